@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Optional
+
+from elasticsearch import AsyncElasticsearch, TransportError
+
+from config import ES_BULK_RETRIES
+from es import (RETRY_SLEEP, BulkError, BulkResult, OrjsonSerializer, bulk_body, bulk_items, chunk_failed, chunks,
+                to_retry)
+from notifier import CacheNotifier
+from transform import Doc
+from utils import async_backoff
+
+logger = logging.getLogger('AsyncESLoader')
+
+
+class AsyncEsSaver:
+    """EsSaver для асинхронного ETL на AsyncElasticsearch.
+
+    Пачка пишется так же, как в EsSaver.load: частями одновременно, с повтором
+    ошибок сети, 429 и 5xx и BulkError, если документы так и не записаны
+    """
+    def __init__(self, host: list, notifier: Optional[CacheNotifier] = None):
+        self.client = AsyncElasticsearch(host, serializer=OrjsonSerializer())
+        self.notifier = notifier
+
+    async def write(self, docs: list[Doc], name_index) -> tuple[list, dict]:
+        try:
+            return bulk_items(await self.client.bulk(body=bulk_body(docs, name_index)))
+        except TransportError as e:
+            return [], chunk_failed(docs, e)
+
+    async def load(self, docs: list[Doc], name_index) -> BulkResult:
+        loaded, rejected, pending = [], [], docs
+        for attempt in range(ES_BULK_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(RETRY_SLEEP * 2 ** (attempt - 1))
+            failed = {}
+            for written, errors in await asyncio.gather(*(self.write(chunk, name_index) for chunk in chunks(pending))):
+                loaded.extend(written)
+                failed.update(errors)
+            retry = to_retry(failed, name_index, rejected)
+            if not retry:
+                break
+            pending = [doc for doc in pending if doc[0] in retry]
+        else:
+            raise BulkError(name_index, retry)
+        return BulkResult(loaded, rejected)
+
+    @async_backoff()
+    async def refresh(self, name_index) -> None:
+        """Один refresh после всей загрузки вместо refresh на каждой пачке"""
+        await self.client.indices.refresh(index=name_index)
+
+    async def notify(self, name_index, ids: Optional[list]) -> None:
+        """То же, что EsSaver.notify. Клиент Redis синхронный: публикация уходит в поток,
+        чтобы не держать цикл событий
+        """
+        if not self.notifier:
+            return
+        if ids is None:
+            await asyncio.to_thread(self.notifier.publish_reindex, name_index)
+        else:
+            await asyncio.to_thread(self.notifier.publish, name_index, ids)
+
+    async def close(self) -> None:
+        await self.client.close()
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from async_es import AsyncEsSaver
+from async_postgresloader import AsyncPostgresLoader, create_pool
+from changes import AsyncChangeTracker
+from config import dsl, es_conf, redis_conf, CACHE_INVALIDATION_CHANNEL, ETL_QUEUE_SIZE, ETL_ASYNC_WORKERS
+from fingerprints import BaseFingerprints, get_fingerprints
+from load_data import INDEXES, job_key, job_marks, loaded_before, marks_key
+from notifier import CacheNotifier
+from pipeline import run_async_pipeline
+from postgresloader import Batch
+from state import State, get_storage
+from utils import async_backoff
+
+logger = logging.getLogger('AsyncLoaderStart')
+
+
+async def transfer_index(pool, saver: AsyncEsSaver, state: State, name_index: str,
+                         fingerprints: Optional[BaseFingerprints] = None) -> None:
+    """Асинхронный вариант load_data.transfer_index для обычного переноса изменений.
+
+    Состояние общее с load_data.py, поэтому загрузчики можно чередовать.
+    Полную переиндексацию в новую версию индекса делает только load_data.py
+    """
+    job = await asyncio.to_thread(state.get_state, job_key(name_index))
+    if job and job.get('target'):
+        logger.warning(f'{datetime.now()}\n\nSkip {name_index}: reindex into {job["target"]} is pending, '
+                       f'finish it with load_data.py --full-reindex')
+        return
+    async with pool.acquire() as conn:
+        marks = job_marks(state, name_index, job or {})
+        if job is None and fingerprints and not marks:
+            await asyncio.to_thread(fingerprints.clear, name_index)
+        # Как и в load_data.py, список id начатого переноса собирается заново от тех же отметок
+        changes = await AsyncChangeTracker(conn).collect(name_index, marks)
+        ids = changes.ids
+        if job is None:
+            job = {'marks': changes.marks, 'after': None}
+            await asyncio.to_thread(state.set_state, job_key(name_index), job)
+        else:
+            logger.info(f'{datetime.now()}\n\nResume {name_index} transfer after {job["after"]}')
+
+        skipped, rejected = 0, 0
+        # Как и в load_data.py, refresh и сброс кеша - только для записанных документов
+        written = loaded_before(ids, job['after'])
+
+        async def load(batch: Batch) -> None:
+            nonlocal skipped, rejected
+            docs, hashes = batch, {}
+            if fingerprints:
+                docs, hashes = await asyncio.to_thread(fingerprints.changed, name_index, batch)
+            skipped += len(batch) - len(docs)
+            if docs:
+                result = await saver.load(docs, name_index)
+                rejected += len(result.rejected)
+                if written is not None:
+                    written.update(result.loaded)
+                if fingerprints:
+                    await asyncio.to_thread(fingerprints.put, name_index,
+                                            {_id: hashes[_id] for _id in result.loaded})
+
+        async def checkpoint(batch: Batch) -> None:
+            job['after'] = batch.after
+            await asyncio.to_thread(state.set_state, job_key(name_index), job)
+
+        if ids is None or ids:
+            await run_async_pipeline(
+                AsyncPostgresLoader(conn).batches(name_index, ids, job['after']),
+                load,
+                name=name_index,
+                queue_size=ETL_QUEUE_SIZE,
+                workers=ETL_ASYNC_WORKERS,
+                on_loaded=checkpoint,
+            )
+            if written is None or written:
+                await saver.refresh(name_index)
+                await saver.notify(name_index, None if written is None else sorted(written))
+            if fingerprints:
+                logger.info(f'{datetime.now()}\n\n{name_index}: {skipped} unchanged documents skipped')
+            if rejected:
+                logger.error(f'{datetime.now()}\n\n{name_index}: {rejected} documents rejected by ES')
+        else:
+            logger.info(f'{datetime.now()}\n\nNo changes for {name_index}')
+    await asyncio.to_thread(state.set_state, marks_key(name_index), job['marks'])
+    await asyncio.to_thread(state.delete_state, job_key(name_index))
+
+
+@async_backoff()
+async def save_elastic(pool, saver: AsyncEsSaver, state: State, name_index: str,
+                       fingerprints: Optional[BaseFingerprints] = None) -> bool:
+    await transfer_index(pool, saver, state, name_index, fingerprints)
+    return True
+
+
+async def main() -> None:
+    """Все индексы переносятся одновременно в одном потоке: выгрузка из Postgres
+    и запись в ES не ждут друг друга, пока идут запросы по сети
+    """
+    pool = await create_pool(dsl, size=len(INDEXES))
+    saver = AsyncEsSaver(es_conf, notifier=CacheNotifier(redis_conf, CACHE_INVALIDATION_CHANNEL))
+    state = State(get_storage())
+    fingerprints = get_fingerprints()
+    try:
+        await asyncio.gather(*(save_elastic(pool, saver, state, name_index, fingerprints) for name_index in INDEXES))
+    finally:
+        await saver.close()
+        await pool.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+from bisect import bisect_right
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+import asyncpg
+import orjson
+
+from config import ETL_BATCH_SIZE
+from db_query import STATEMENTS
+from postgresloader import Batch, KEYSET_START
+from transform import to_docs
+
+
+async def init_connection(conn: asyncpg.Connection) -> None:
+    """Кодеки, с которыми строки asyncpg совпадают со строками psycopg2:
+    uuid приходят строками, jsonb - разобранным JSON
+    """
+    await conn.set_type_codec('uuid', encoder=str, decoder=str, schema='pg_catalog', format='text')
+    await conn.set_type_codec('jsonb', encoder=lambda v: orjson.dumps(v).decode(), decoder=orjson.loads,
+                              schema='pg_catalog', format='text')
+
+
+async def create_pool(dsl: dict, size: int) -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        database=dsl['dbname'],
+        user=dsl['user'],
+        password=dsl['password'],
+        host=dsl['host'],
+        port=int(dsl['port']) if dsl['port'] else None,
+        min_size=1,
+        max_size=size,
+        init=init_connection,
+    )
+
+
+class AsyncPostgresLoader:
+    """PostgresLoader для asyncpg: те же запросы и пачки с контрольными точками.
+
+    asyncpg сам готовит запросы на соединении и кеширует подготовленные
+    операторы. Строки приходят в двоичном формате, кроме uuid и jsonb: их
+    текстовые кодеки дают те же строки и словари, что psycopg2.
+    Выгрузка идет теми же страницами по ключу (updated_at, id), что и
+    в PostgresLoader, а не одним курсором: курсор держал бы транзакцию
+    открытой на все время переноса
+    """
+    def __init__(self, conn: asyncpg.Connection, batch_size: int = ETL_BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+
+    async def fetch(self, name: str, *args) -> list:
+        return await self.conn.fetch(STATEMENTS[name][1], *args)
+
+    async def batches(self, name_index: str, ids: Optional[list] = None, after=None) -> AsyncIterator[Batch]:
+        """Без ids - вся таблица страницами по ключу (updated_at, id), иначе строки с этими id"""
+        if ids is None:
+            key = (datetime.fromisoformat(after[0]), after[1]) if after else KEYSET_START
+            while True:
+                rows = await self.fetch(f'{name_index}_page', *key, self.batch_size)
+                if rows:
+                    yield Batch(to_docs(rows, name_index), [rows[-1][1].isoformat(), rows[-1][0]])
+                if len(rows) < self.batch_size:
+                    return
+                key = (rows[-1][1], rows[-1][0])
+        for start in range(bisect_right(ids, after) if after else 0, len(ids), self.batch_size):
+            chunk = ids[start:start + self.batch_size]
+            rows = await self.fetch(f'{name_index}_by_ids', chunk)
+            yield Batch(to_docs(rows, name_index), chunk[-1])
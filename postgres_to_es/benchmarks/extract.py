@@ -0,0 +1,56 @@
+"""Скорость выгрузки фильмов из Postgres: отдельно запрос и запрос со сборкой документов.
+
+Замеряется полная выгрузка и выгрузка по списку случайных id, как в
+инкрементальном цикле. Запускать из postgres_to_es/ на базе из dump.sql,
+для сравнения - на двух ревизиях:
+
+    python -m benchmarks.extract
+    git checkout <другая ревизия> && python -m benchmarks.extract
+"""
+import argparse
+import random
+import time
+from contextlib import closing
+
+import psycopg2
+from psycopg2.extras import DictCursor
+
+from config import dsl
+from postgresloader import PostgresLoader
+
+
+def measure(extract, repeat: int) -> tuple[int, float]:
+    """Число документов и лучшее время из repeat прогонов"""
+    best, rows = float('inf'), 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = sum(len(batch) for batch in extract())
+        best = min(best, time.perf_counter() - started)
+    return rows, best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--ids', type=int, default=200, help='сколько фильмов выгружать по id')
+    args = parser.parse_args()
+
+    with closing(psycopg2.connect(**dsl, cursor_factory=DictCursor)) as pg_conn:
+        with pg_conn.cursor() as cursor:
+            cursor.execute('SELECT id FROM content.film_work ORDER BY id')
+            all_ids = [row[0] for row in cursor.fetchall()]
+        ids = random.Random(0).sample(all_ids, min(args.ids, len(all_ids)))
+        loader = PostgresLoader(pg_conn)
+        for name, extract in (
+                ('full query', lambda: loader.fetch_by_ids('movies')),
+                ('full docs', lambda: loader.batches('movies')),
+                (f'{len(ids)} ids query', lambda: loader.fetch_by_ids('movies', ids)),
+                (f'{len(ids)} ids docs', lambda: loader.batches('movies', ids)),
+        ):
+            rows, seconds = measure(extract, args.repeat)
+            print(f'{name:>15}: {rows} films in {seconds * 1000:.1f} ms ({rows / seconds:.0f} films/s)')
+            pg_conn.rollback()
+
+
+if __name__ == '__main__':
+    main()
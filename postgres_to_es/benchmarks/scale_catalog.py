@@ -0,0 +1,90 @@
+"""Синтетический каталог в factor раз больше исходного для замеров ETL.
+
+Создает базу <база>_x<factor> копией базы из dump.sql и добавляет в нее
+factor - 1 копий фильмов и персон со всеми связями. Копия получает id
+md5(id/номер копии), поэтому каталог одинаков при каждом запуске, а у копий
+то же распределение актеров, жанров и updated_at, что у исходных строк.
+Жанры не копируются: их в любом каталоге немного. Запускать из postgres_to_es/,
+к исходной базе в это время никто не должен быть подключен:
+
+    python -m benchmarks.scale_catalog --factor 10
+    POSTGRES_DB=movies_x10 ETL_STATE_FILE=x10.state ETL_FINGERPRINTS=off python load_data.py --profile profile/x10
+"""
+import argparse
+import time
+from contextlib import closing
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from config import dsl
+
+# Копия n строки получает id md5(id/n), так же пересчитываются ссылки на копии
+COPY_ID = "md5({column}::text || '/' || n)::uuid"
+
+COPIES = {
+    'film_work': '''
+        INSERT INTO content.film_work
+            (id, title, description, creation_date, certificate, file_path, rating, type, created_at, updated_at)
+        SELECT {id}, title, description, creation_date, certificate, file_path, rating, type, created_at, updated_at
+        FROM content.film_work, generate_series(1, %(copies)s) AS n
+    ''',
+    'person': '''
+        INSERT INTO content.person (id, full_name, birth_date, created_at, updated_at)
+        SELECT {id}, full_name, birth_date, created_at, updated_at
+        FROM content.person, generate_series(1, %(copies)s) AS n
+    ''',
+    'genre_film_work': '''
+        INSERT INTO content.genre_film_work (id, film_work_id, genre_id, created_at)
+        SELECT {id}, {film_id}, genre_id, created_at
+        FROM content.genre_film_work, generate_series(1, %(copies)s) AS n
+    ''',
+    'person_film_work': '''
+        INSERT INTO content.person_film_work (id, film_work_id, person_id, role, created_at)
+        SELECT {id}, {film_id}, {person_id}, role, created_at
+        FROM content.person_film_work, generate_series(1, %(copies)s) AS n
+    ''',
+}
+
+
+def copy_query(template: str) -> str:
+    return template.format(
+        id=COPY_ID.format(column='id'),
+        film_id=COPY_ID.format(column='film_work_id'),
+        person_id=COPY_ID.format(column='person_id'),
+    )
+
+
+def create_database(source: str, target: str) -> None:
+    """Новая база из исходной как из шаблона, через служебную базу postgres"""
+    with closing(psycopg2.connect(**(dsl | {'dbname': 'postgres'}))) as conn:
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL('DROP DATABASE IF EXISTS {}').format(sql.Identifier(target)))
+            cursor.execute(sql.SQL('CREATE DATABASE {} TEMPLATE {}').format(
+                sql.Identifier(target), sql.Identifier(source)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--factor', type=int, required=True, help='во сколько раз увеличить каталог')
+    parser.add_argument('--target', help='имя новой базы, по умолчанию <база>_x<factor>')
+    args = parser.parse_args()
+    target = args.target or f'{dsl["dbname"]}_x{args.factor}'
+
+    started = time.perf_counter()
+    create_database(dsl['dbname'], target)
+    with closing(psycopg2.connect(**(dsl | {'dbname': target}))) as conn:
+        with conn, conn.cursor() as cursor:
+            for table, template in COPIES.items():
+                cursor.execute(copy_query(template), {'copies': args.factor - 1})
+                print(f'{table}: {cursor.rowcount} rows added')
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    print(f'{target} created in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Скорость превращения строк Postgres в JSON документов ES, документов в секунду.
+
+Строки выгружаются один раз, дальше замеряется только преобразование:
+- orjson - рабочий путь transform.to_docs;
+- validate - тот же путь с проверкой pydantic-моделью (ETL_VALIDATE=True);
+- pydantic + json - прежний путь: модель из schemas.py, .dict() и
+  стандартный json для строки действия и документа, как в bulk-хелпере.
+
+Запускать из postgres_to_es/ на базе из dump.sql:
+
+    python -m benchmarks.transform
+"""
+import argparse
+import time
+from contextlib import closing
+
+import psycopg2
+from elasticsearch import JSONSerializer
+
+from config import dsl
+from postgresloader import PostgresLoader
+from transform import TRANSFORMS, to_docs
+
+
+def pydantic_json(rows: list, name_index: str) -> list:
+    build, model = TRANSFORMS[name_index]
+    serializer = JSONSerializer()
+    docs = []
+    for row in rows:
+        doc = model(**build(row)).dict()
+        serializer.dumps({'index': {'_index': name_index, '_id': doc['id']}})
+        docs.append(serializer.dumps(doc))
+    return docs
+
+
+def measure(transform, repeat: int) -> float:
+    """Лучшее время из repeat прогонов"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        transform()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with closing(psycopg2.connect(**dsl)) as pg_conn:
+        loader = PostgresLoader(pg_conn)
+        for name_index in TRANSFORMS:
+            rows = [row for batch in loader.fetch_by_ids(name_index) for row in batch]
+            for name, transform in (
+                    ('orjson', lambda: to_docs(rows, name_index, validate=False)),
+                    ('validate', lambda: to_docs(rows, name_index, validate=True)),
+                    ('pydantic + json', lambda: pydantic_json(rows, name_index)),
+            ):
+                seconds = measure(transform, args.repeat)
+                print(f'{name_index:>6} {name:>15}: {len(rows)} docs in {seconds * 1000:.1f} ms '
+                      f'({len(rows) / seconds:.0f} docs/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from psycopg2.extensions import connection as _connection
+
+from config import ETL_BATCH_SIZE
+from db_query import STATEMENTS
+from prepared import execute
+
+# Таблицы-источники каждого индекса. Индекс хранит свою отметку (updated_at, id)
+# по каждой из них и переносится независимо от остальных
+SOURCES = {
+    'movies': ('film_work', 'genre', 'person'),
+    'genre': ('genre',),
+    'person': ('person',),
+}
+
+
+class Changes(NamedTuple):
+    """Что нужно перевыгрузить в индекс.
+
+    ids равен None, если индекс выгружается целиком (для какой-то
+    из таблиц еще нет отметки), иначе отсортирован: контрольная точка переноса
+    по списку - последний загруженный id. marks - новые отметки таблиц
+    """
+    ids: Optional[list]
+    marks: dict
+
+
+class ChangeTracker:
+    """Этап определения изменений.
+
+    По каждой таблице выбирает строки, измененные после сохраненной отметки,
+    и разворачивает измененные жанры и персоны в id фильмов, в которые они входят.
+    Отметка берется по последней увиденной строке, а не по времени запуска,
+    поэтому строки, измененные во время переноса, попадут в следующий запуск
+    """
+    def __init__(self, pg_conn: _connection, batch_size: int = ETL_BATCH_SIZE):
+        self.conn = pg_conn
+        self.batch_size = batch_size
+
+    def changed(self, table: str, mark: Optional[dict]) -> tuple[Optional[list], Optional[dict]]:
+        """Id измененных строк таблицы и новая отметка. None вместо id - таблица целиком"""
+        with self.conn.cursor() as cursor:
+            if mark is None:
+                execute(cursor, f'{table}_last')
+                row = cursor.fetchone()
+                return None, row and self.mark(row)
+            ids = []
+            while True:
+                execute(cursor, f'{table}_changed', mark['updated_at'], mark['id'], self.batch_size)
+                rows = cursor.fetchall()
+                if not rows:
+                    return ids, mark
+                ids.extend(row[0] for row in rows)
+                mark = self.mark(rows[-1])
+
+    def film_ids(self, name: str, ids: list) -> set:
+        """Id фильмов, в которые входят измененные жанры или персоны, запросами по пачкам id"""
+        film_ids = set()
+        with self.conn.cursor() as cursor:
+            for start in range(0, len(ids), self.batch_size):
+                execute(cursor, name, ids[start:start + self.batch_size])
+                film_ids.update(row[0] for row in cursor.fetchall())
+        return film_ids
+
+    def collect(self, name_index: str, marks: dict) -> Changes:
+        """Изменения для индекса после его отметок marks; пустые marks - выгрузить все"""
+        changed = {table: self.changed(table, marks.get(table)) for table in SOURCES[name_index]}
+        new_marks = {table: mark for table, (_, mark) in changed.items()}
+        if any(ids is None for ids, _ in changed.values()):
+            return Changes(None, new_marks)
+        if name_index != 'movies':
+            return Changes(sorted(changed[name_index][0]), new_marks)
+        movies = set(changed['film_work'][0])
+        movies |= self.film_ids('film_ids_by_genre', changed['genre'][0])
+        movies |= self.film_ids('film_ids_by_person', changed['person'][0])
+        return Changes(sorted(movies), new_marks)
+
+    @staticmethod
+    def mark(row) -> dict:
+        return {'updated_at': row[1].isoformat(), 'id': row[0]}
+
+
+class AsyncChangeTracker:
+    """ChangeTracker для асинхронного ETL: те же запросы через соединение asyncpg,
+    которое само готовит и кеширует операторы
+    """
+    def __init__(self, conn, batch_size: int = ETL_BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+
+    async def fetch(self, name: str, *args) -> list:
+        return await self.conn.fetch(STATEMENTS[name][1], *args)
+
+    async def changed(self, table: str, mark: Optional[dict]) -> tuple[Optional[list], Optional[dict]]:
+        if mark is None:
+            rows = await self.fetch(f'{table}_last')
+            return None, ChangeTracker.mark(rows[0]) if rows else None
+        ids = []
+        after = (datetime.fromisoformat(mark['updated_at']), mark['id'])
+        while True:
+            rows = await self.fetch(f'{table}_changed', *after, self.batch_size)
+            if not rows:
+                return ids, mark
+            ids.extend(row[0] for row in rows)
+            mark = ChangeTracker.mark(rows[-1])
+            after = (rows[-1][1], rows[-1][0])
+
+    async def film_ids(self, name: str, ids: list) -> set:
+        film_ids = set()
+        for start in range(0, len(ids), self.batch_size):
+            rows = await self.fetch(name, ids[start:start + self.batch_size])
+            film_ids.update(row[0] for row in rows)
+        return film_ids
+
+    async def collect(self, name_index: str, marks: dict) -> Changes:
+        changed = {table: await self.changed(table, marks.get(table)) for table in SOURCES[name_index]}
+        new_marks = {table: mark for table, (_, mark) in changed.items()}
+        if any(ids is None for ids, _ in changed.values()):
+            return Changes(None, new_marks)
+        if name_index != 'movies':
+            return Changes(sorted(changed[name_index][0]), new_marks)
+        movies = set(changed['film_work'][0])
+        movies |= await self.film_ids('film_ids_by_genre', changed['genre'][0])
+        movies |= await self.film_ids('film_ids_by_person', changed['person'][0])
+        return Changes(sorted(movies), new_marks)
@@ -22,3 +22,47 @@ es_conf = [{
     'host': os.getenv('ELASTIC_HOST'),
     'port': os.getenv('ELASTIC_PORT'),
 }]
+
+redis_conf = {
+    'host': os.getenv('REDIS_HOST'),
+    'port': int(os.getenv('REDIS_PORT', 6379)),
+}
+
+# Канал, через который API узнает об изменившихся документах
+CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL', 'cache_invalidation')
+
+# Сколько пачек может ждать загрузки в ES, пока идет выгрузка из Postgres
+ETL_QUEUE_SIZE = int(os.getenv('ETL_QUEUE_SIZE', 4))
+
+# Размер пачки: столько строк серверный курсор отдает за один раз
+ETL_BATCH_SIZE = int(os.getenv('ETL_BATCH_SIZE', 500))
+
+# Где хранится состояние ETL (отметки и контрольные точки переноса): file или redis
+ETL_STATE_STORAGE = os.getenv('ETL_STATE_STORAGE', 'file')
+ETL_STATE_FILE = os.getenv('ETL_STATE_FILE', 'PostgresDataState.txt')
+ETL_STATE_REDIS_KEY = os.getenv('ETL_STATE_REDIS_KEY', 'etl_state')
+
+# Демон ETL просыпается по NOTIFY из Postgres, а без уведомлений проверяет изменения раз в ETL_POLL_INTERVAL секунд.
+# ETL_NOTIFY_DEBOUNCE - пауза после уведомления, чтобы забрать серию изменений одним циклом
+ETL_POLL_INTERVAL = float(os.getenv('ETL_POLL_INTERVAL', 60))
+ETL_NOTIFY_DEBOUNCE = float(os.getenv('ETL_NOTIFY_DEBOUNCE', 0.1))
+
+# Отладка: каждый документ дополнительно проверяется pydantic-моделью из schemas.py
+ETL_VALIDATE = os.getenv('ETL_VALIDATE', 'False') == 'True'
+
+# Асинхронный ETL (async_load_data.py): сколько пачек одного индекса пишутся в ES одновременно
+ETL_ASYNC_WORKERS = int(os.getenv('ETL_ASYNC_WORKERS', 4))
+
+# Хеши записанных документов: неизменившиеся документы не отправляются в ES повторно.
+# ETL_FINGERPRINTS: sqlite, redis или off
+ETL_FINGERPRINTS = os.getenv('ETL_FINGERPRINTS', 'sqlite')
+ETL_FINGERPRINTS_FILE = os.getenv('ETL_FINGERPRINTS_FILE', 'fingerprints.sqlite3')
+ETL_FINGERPRINTS_REDIS_PREFIX = os.getenv('ETL_FINGERPRINTS_REDIS_PREFIX', 'etl_fingerprints:')
+
+# Параметры записи в ES: пачка режется на части по числу документов и по размеру в байтах,
+# части отправляются одновременно из ES_BULK_THREADS потоков. По умолчанию части
+# как раз хватает на все потоки
+ES_BULK_THREADS = int(os.getenv('ES_BULK_THREADS', 4))
+ES_BULK_CHUNK_SIZE = int(os.getenv('ES_BULK_CHUNK_SIZE', max(1, ETL_BATCH_SIZE // ES_BULK_THREADS)))
+ES_BULK_MAX_BYTES = int(os.getenv('ES_BULK_MAX_BYTES', 10 * 1024 * 1024))
+ES_BULK_RETRIES = int(os.getenv('ES_BULK_RETRIES', 3))
@@ -0,0 +1,4 @@
+import os
+
+# config.py берет уровень логов из окружения: в контейнере его задает .env
+os.environ.setdefault('LOGGING_LEVEL', 'WARNING')
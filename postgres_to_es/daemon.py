@@ -0,0 +1,138 @@
+import logging
+import select
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+import psycopg2
+from psycopg2.extensions import connection as _connection, ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import dsl, es_conf, redis_conf, CACHE_INVALIDATION_CHANNEL, ETL_POLL_INTERVAL, ETL_NOTIFY_DEBOUNCE
+from es import EsSaver
+from fingerprints import get_fingerprints
+from load_data import INDEXES, transfer_index
+from migrate import apply_migrations
+from notifier import CacheNotifier
+from state import State, get_storage
+from utils import backoff
+
+logger = logging.getLogger('EtlDaemon')
+
+# Канал, в который пишут триггеры из migrations/001_etl_notify.sql
+NOTIFY_CHANNEL = 'etl_changes'
+
+
+class EtlDaemon:
+    """Постоянно работающий ETL.
+
+    Соединения с Postgres, ES и Redis живут между циклами. Цикл запускается
+    по NOTIFY от триггеров на таблицах-источниках, а если уведомлений нет,
+    то раз в ETL_POLL_INTERVAL секунд
+    """
+    def __init__(self):
+        # Пул создается в start(), чтобы недоступный Postgres ждать через backoff
+        self.pool: Optional[ThreadedConnectionPool] = None
+        self.saver = EsSaver(es_conf, notifier=CacheNotifier(redis_conf, CACHE_INVALIDATION_CHANNEL))
+        self.state = State(get_storage())
+        self.fingerprints = get_fingerprints()
+        self.executor = ThreadPoolExecutor(max_workers=len(INDEXES))
+        self.listener: Optional[_connection] = None
+
+    @contextmanager
+    def connection(self) -> Iterator[_connection]:
+        """Соединение из пула. Сломанное соединение закрывается, а не возвращается в пул"""
+        pg_conn = self.pool.getconn()
+        broken = False
+        try:
+            yield pg_conn
+        except psycopg2.Error:
+            broken = True
+            raise
+        finally:
+            self.pool.putconn(pg_conn, close=broken or bool(pg_conn.closed))
+
+    def listen(self) -> _connection:
+        """Отдельное соединение без транзакций, на котором приходят уведомления"""
+        listener = psycopg2.connect(**dsl)
+        listener.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with listener.cursor() as cursor:
+            cursor.execute(f'LISTEN {NOTIFY_CHANNEL};')
+        return listener
+
+    @backoff()
+    def start(self) -> bool:
+        """Ставит триггеры и подписывается на уведомления до первого цикла,
+        чтобы не пропустить изменения, сделанные во время него.
+
+        Пул держит по соединению на индекс: при minconn меньше этого putconn
+        закрывал бы лишние соединения, и каждый цикл заново подключался бы
+        и готовил операторы из prepared.py
+        """
+        if self.pool is None:
+            self.pool = ThreadedConnectionPool(len(INDEXES), len(INDEXES), **dsl, cursor_factory=DictCursor)
+        with self.connection() as pg_conn:
+            apply_migrations(pg_conn)
+        self.listener = self.listen()
+        return True
+
+    def transfer(self, name_index: str) -> None:
+        with self.connection() as pg_conn:
+            transfer_index(pg_conn, self.saver, self.state, name_index, fingerprints=self.fingerprints)
+
+    @backoff()
+    def cycle(self) -> bool:
+        """Один проход: каждый индекс сам находит свои изменения, переносит их
+        и сохраняет отметки, поэтому сбой одного индекса не откатывает другие
+        """
+        futures = [self.executor.submit(self.transfer, name_index) for name_index in INDEXES]
+        # Ждем все индексы, чтобы повтор цикла не пересекся с еще идущим переносом
+        wait(futures)
+        for future in futures:
+            future.result()
+        return True
+
+    def wait(self) -> None:
+        """Ждет уведомления об изменениях, но не дольше ETL_POLL_INTERVAL секунд"""
+        try:
+            if self.listener is None or self.listener.closed:
+                self.listener = self.listen()
+            if select.select([self.listener], [], [], ETL_POLL_INTERVAL) == ([], [], []):
+                return
+            # Изменения обычно идут серией: короткая пауза собирает их в один цикл
+            time.sleep(ETL_NOTIFY_DEBOUNCE)
+            self.listener.poll()
+            tables = {notify.payload for notify in self.listener.notifies}
+            self.listener.notifies.clear()
+            logger.info(f'{datetime.now()}\n\nChanges notified for {", ".join(sorted(tables))}')
+        except psycopg2.Error as e:
+            logger.error(f'{datetime.now()}\n\nListener connection lost: {e}')
+            if self.listener is not None:
+                self.listener.close()
+            self.listener = None
+            time.sleep(ETL_POLL_INTERVAL)
+
+    def run(self) -> None:
+        self.start()
+        try:
+            while True:
+                self.cycle()
+                self.wait()
+        finally:
+            self.executor.shutdown()
+            self.saver.close()
+            if self.listener is not None:
+                self.listener.close()
+            if self.pool is not None:
+                self.pool.closeall()
+
+
+if __name__ == '__main__':
+    # docker stop шлет SIGTERM: завершаемся через SystemExit, чтобы закрыть соединения
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    EtlDaemon().run()
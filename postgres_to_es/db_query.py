@@ -1,41 +1,91 @@
-load_person_q = f'''SELECT DISTINCT id
-                    FROM content.person
-                    GROUP BY id
-                    '''
-
-load_person_role = f'''SELECT p.id, p.full_name, p.birth_date,
-                    ARRAY_AGG(DISTINCT pfw.role) AS role,
-                    ARRAY_AGG(DISTINCT pfw.film_work_id) AS film_ids
-                    FROM content.person as p
-                    LEFT JOIN content.person_film_work as pfw ON p.id = pfw.person_id
-                    GROUP BY p.id
-                    '''
-
-load_film_id = f'''SELECT DISTINCT fw.id
-                    FROM content.film_work as fw
-                    LEFT JOIN content.person_film_work as pfw ON pfw.film_work_id = fw.id
-                    WHERE pfw.person_id IN (%s)
-                    GROUP BY fw.id
-                    '''
-
-big_request = """ARRAY_AGG(DISTINCT jsonb_build_object('id', g.id, 'name', g.name)) AS genre,
-ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'director') AS director,
-ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'actor') AS actors,
-ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'writer') AS writers,
-ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors_names,
-ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers_names"""
-
-full_load = f'''SELECT DISTINCT fw.id, fw.title, fw.description, fw.rating, fw.type,
-                          fw.updated_at, {big_request}
-                            FROM content.film_work as fw
-                            LEFT JOIN content.person_film_work as pfw ON pfw.film_work_id = fw.id
-                            LEFT JOIN content.person as p ON p.id = pfw.person_id
-                            LEFT JOIN content.genre_film_work as gfw ON gfw.film_work_id = fw.id
-                            LEFT JOIN content.genre as g ON g.id = gfw.genre_id
-                            WHERE fw.id IN (%s)
-                            GROUP BY fw.id
-                            ORDER BY fw.updated_at;'''
-
-query_all_genre = f'''SELECT id, name, description
-                 FROM content.genre
-                 ORDER BY created_at;'''
+# Все запросы выполняются как подготовленные операторы (см. prepared.py):
+# имя -> (типы параметров, текст запроса с $1, $2...). Значения никогда не
+# вклеиваются в текст запроса.
+#
+# Выгрузка всей таблицы идет страницами по ключу (updated_at, id): следующая
+# страница начинается после последней строки предыдущей и читается по индексу
+# из migrations/002_etl_indexes.sql, без OFFSET и без долгого курсора.
+# Запросы выгрузки начинаются с колонок id, updated_at - это ключ страницы
+
+# Страница строк таблицы после ключа ($1, $2) размером $3
+keyset_page = '''SELECT {columns} FROM content.{table}
+                 WHERE (updated_at, id) > ($1, $2)
+                 ORDER BY updated_at, id
+                 LIMIT $3'''
+
+# Строки таблицы из списка id $1
+by_ids = '''SELECT {columns} FROM content.{table}
+            WHERE id = ANY($1)'''
+
+# Жанры и персоны фильма собираются отдельными подзапросами на каждый фильм:
+# общий JOIN жанров и персон перемножал их строки перед группировкой
+film_query = """SELECT fw.id, fw.updated_at, fw.title, fw.description, fw.rating,
+                       g.genre, p.director, p.actors, p.writers, p.actors_names, p.writers_names
+                FROM ({films}) AS fw
+                LEFT JOIN LATERAL (
+                    SELECT ARRAY_AGG(DISTINCT jsonb_build_object('id', g.id, 'name', g.name)) AS genre
+                    FROM content.genre_film_work AS gfw
+                    JOIN content.genre AS g ON g.id = gfw.genre_id
+                    WHERE gfw.film_work_id = fw.id
+                ) AS g ON TRUE
+                LEFT JOIN LATERAL (
+                    SELECT
+                    ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'director') AS director,
+                    ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'actor') AS actors,
+                    ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'writer') AS writers,
+                    ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors_names,
+                    ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers_names
+                    FROM content.person_film_work AS pfw
+                    JOIN content.person AS p ON p.id = pfw.person_id
+                    WHERE pfw.film_work_id = fw.id
+                ) AS p ON TRUE
+                ORDER BY fw.updated_at, fw.id"""
+
+person_query = '''SELECT p.id, p.updated_at, p.full_name, p.birth_date, r.role, r.film_ids
+                  FROM ({persons}) AS p
+                  LEFT JOIN LATERAL (
+                      SELECT ARRAY_AGG(DISTINCT pfw.role)::text[] AS role,
+                             ARRAY_AGG(DISTINCT pfw.film_work_id)::text[] AS film_ids
+                      FROM content.person_film_work AS pfw
+                      WHERE pfw.person_id = p.id
+                  ) AS r ON TRUE
+                  ORDER BY p.updated_at, p.id'''
+
+genre_query = '''SELECT id, updated_at, name, description
+                 FROM ({genres}) AS g
+                 ORDER BY updated_at, id'''
+
+# Фильмы, в которые входят измененные персоны и жанры
+film_ids_by_person = '''SELECT DISTINCT film_work_id
+                        FROM content.person_film_work
+                        WHERE person_id = ANY($1)'''
+
+film_ids_by_genre = '''SELECT DISTINCT film_work_id
+                       FROM content.genre_film_work
+                       WHERE genre_id = ANY($1)'''
+
+# Последняя строка таблицы: отметка для первого запуска, когда выгружается все
+last_row = '''SELECT id, updated_at
+              FROM content.{table}
+              WHERE updated_at IS NOT NULL
+              ORDER BY updated_at DESC, id DESC
+              LIMIT 1'''
+
+KEYSET = 'timestamptz, uuid, int'
+IDS = 'uuid[]'
+
+STATEMENTS = {
+    'movies_page': (KEYSET, film_query.format(films=keyset_page.format(columns='*', table='film_work'))),
+    'movies_by_ids': (IDS, film_query.format(films=by_ids.format(columns='*', table='film_work'))),
+    'person_page': (KEYSET, person_query.format(persons=keyset_page.format(columns='*', table='person'))),
+    'person_by_ids': (IDS, person_query.format(persons=by_ids.format(columns='*', table='person'))),
+    'genre_page': (KEYSET, genre_query.format(genres=keyset_page.format(columns='*', table='genre'))),
+    'genre_by_ids': (IDS, genre_query.format(genres=by_ids.format(columns='*', table='genre'))),
+    'film_ids_by_person': (IDS, film_ids_by_person),
+    'film_ids_by_genre': (IDS, film_ids_by_genre),
+}
+
+# Поиск изменений: те же страницы по ключу, но только id и updated_at
+for _table in ('film_work', 'genre', 'person'):
+    STATEMENTS[f'{_table}_changed'] = (KEYSET, keyset_page.format(columns='id, updated_at', table=_table))
+    STATEMENTS[f'{_table}_last'] = ('', last_row.format(table=_table))
@@ -1,19 +1,116 @@
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Iterator, NamedTuple, Optional
 
-from elasticsearch import Elasticsearch
+import orjson
+from elasticsearch import Elasticsearch, JSONSerializer, TransportError
+from config import ES_BULK_CHUNK_SIZE, ES_BULK_MAX_BYTES, ES_BULK_THREADS, ES_BULK_RETRIES
+from notifier import CacheNotifier
+from transform import Doc
 from utils import backoff
 
 
 logger = logging.getLogger('ESLoader')
 
+# На время полной загрузки индекс не обновляется и не реплицируется
+BULK_LOAD_SETTINGS = {'refresh_interval': '-1', 'number_of_replicas': 0}
+FORCEMERGE_TIMEOUT = 60 * 30
+# Пауза перед первым повтором упавших документов, дальше она удваивается
+RETRY_SLEEP = 0.1
+
+
+class BulkError(Exception):
+    """Документы, не записанные в ES и после всех повторов: пачку нельзя считать загруженной"""
+    def __init__(self, name_index: str, failed: dict):
+        self.failed = failed
+        _id, result = next(iter(failed.items()))
+        super().__init__(f'{len(failed)} documents were not loaded into {name_index}, '
+                         f'document {_id}: {result.get("error")}')
+
+
+class BulkResult(NamedTuple):
+    """id записанных документов и документов, которые ES отверг как некорректные"""
+    loaded: list
+    rejected: list
+
+
+def is_retryable(status) -> bool:
+    """Повторять имеет смысл только перегрузку (429) и ошибки сервера/сети"""
+    return not isinstance(status, int) or status == 429 or status >= 500
+
+
+def chunks(docs: list[Doc], chunk_size: int = ES_BULK_CHUNK_SIZE,
+           max_bytes: int = ES_BULK_MAX_BYTES) -> Iterator[list[Doc]]:
+    """Части пачки для отдельных bulk-запросов: не больше chunk_size документов и max_bytes байт"""
+    chunk, size = [], 0
+    for doc in docs:
+        if chunk and (len(chunk) == chunk_size or size + len(doc[1]) > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(doc)
+        size += len(doc[1])
+    if chunk:
+        yield chunk
+
+
+def bulk_body(docs: list[Doc], name_index) -> list:
+    body = []
+    for _id, source in docs:
+        body.append({'index': {'_index': name_index, '_id': _id}})
+        body.append(source)
+    return body
+
+
+def bulk_items(response: dict) -> tuple[list, dict]:
+    """id записанных документов и ошибки остальных из ответа bulk"""
+    loaded, failed = [], {}
+    for item in response['items']:
+        result = next(iter(item.values()))
+        if 200 <= result['status'] < 300:
+            loaded.append(result['_id'])
+        else:
+            failed[result['_id']] = result
+    return loaded, failed
+
+
+def chunk_failed(docs: list[Doc], error: TransportError) -> dict:
+    """Весь bulk-запрос не прошел: ошибка относится к каждому его документу"""
+    result = {'status': error.status_code, 'error': repr(error)}
+    return {_id: result for _id, _ in docs}
+
+
+def to_retry(failed: dict, name_index, rejected: list) -> dict:
+    """Ошибки, которые стоит повторить; документы, отвергнутые ES, дописывает в rejected"""
+    retry = {}
+    for _id, result in failed.items():
+        if is_retryable(result.get('status')):
+            retry[_id] = result
+        else:
+            logger.error(f'{datetime.now()}\n\nDocument {_id} was rejected by {name_index}: {result.get("error")}')
+            rejected.append(_id)
+    return retry
+
+
+class OrjsonSerializer(JSONSerializer):
+    """Строки (готовые документы) передаются как есть, остальное - через orjson"""
+    def dumps(self, data):
+        if isinstance(data, (str, bytes)):
+            return data
+        return orjson.dumps(data, default=self.default).decode()
+
+    def loads(self, s):
+        return orjson.loads(s)
+
 
 class EsSaver:
-    def __init__(self, host: list, state_key='my_key'):
-        self.client = Elasticsearch(host)
-        self.movies_list = []
-        self.key = state_key
+    def __init__(self, host: list, notifier: Optional[CacheNotifier] = None):
+        self.client = Elasticsearch(host, serializer=OrjsonSerializer())
+        self.notifier = notifier
+        # Пул живет столько же, сколько клиент: пачки не создают потоки заново
+        self.executor = ThreadPoolExecutor(max_workers=ES_BULK_THREADS, thread_name_prefix='es-bulk')
 
     @backoff()
     def create_index(self, file_path, name_index) -> None:
@@ -24,29 +121,102 @@ class EsSaver:
 
         self.client.index(index=name_index, body=f)
 
+    def create_versioned_index(self, file_path, alias) -> str:
+        """Создает новую версию индекса из схемы с настройками для массовой загрузки"""
+        with open(file_path, 'r') as file:
+            body = json.load(file)
+        body['settings'] = body.get('settings', {}) | BULK_LOAD_SETTINGS
+        name_index = f'{alias}_{datetime.now():%Y%m%d%H%M%S%f}'
+        self.client.indices.create(index=name_index, body=body)
+        logger.info(f'{datetime.now()}\n\nindex {name_index} created for full reindex of {alias}')
+        return name_index
+
+    def finish_bulk_load(self, file_path, name_index) -> None:
+        """Возвращает настройки из схемы и сливает сегменты после массовой загрузки"""
+        with open(file_path, 'r') as file:
+            settings = json.load(file).get('settings', {})
+        self.client.indices.put_settings(
+            index=name_index,
+            body={'index': {
+                'refresh_interval': settings.get('refresh_interval', '1s'),
+                'number_of_replicas': settings.get('number_of_replicas', 1),
+            }},
+        )
+        self.client.indices.refresh(index=name_index)
+        self.client.indices.forcemerge(index=name_index, max_num_segments=1, request_timeout=FORCEMERGE_TIMEOUT)
+
+    def drop_index(self, name_index) -> None:
+        """Удаляет недостроенную версию индекса"""
+        self.client.indices.delete(index=name_index, ignore_unavailable=True)
+        logger.info(f'{datetime.now()}\n\nindex {name_index} dropped')
+
+    def switch_alias(self, alias, name_index) -> None:
+        """Атомарно переключает алиас на новый индекс и удаляет старые версии.
+
+        Если вместо алиаса есть обычный индекс с таким именем (создан es_init),
+        он удаляется в том же запросе
+        """
+        actions, old_indexes = [], []
+        if self.client.indices.exists_alias(name=alias):
+            old_indexes = list(self.client.indices.get_alias(name=alias))
+            actions.extend({'remove': {'index': old, 'alias': alias}} for old in old_indexes)
+        elif self.client.indices.exists(index=alias):
+            actions.append({'remove_index': {'index': alias}})
+        actions.append({'add': {'index': name_index, 'alias': alias}})
+        self.client.indices.update_aliases(body={'actions': actions})
+        logger.info(f'{datetime.now()}\n\nalias {alias} switched to {name_index}')
+        for old in old_indexes:
+            if old != name_index:
+                self.client.indices.delete(index=old)
+
     @backoff()
-    def load_data(self, name_index) -> None:
-        self.client.bulk(body='\n'.join(self.movies_list) + '\n', index=name_index, refresh=True)
-
-    def load(self, query, name_index) -> None:
-        while query:
-            rows = iter(query)
-            for row in rows:
-                self.movies_list.extend(
-                    [
-                        json.dumps(
-                            {
-                                'index': {
-                                    '_index': name_index,
-                                    '_id': row['id']
-                                }
-                            }
-                        ),
-                        json.dumps(row),
-                    ]
-                )
-                if len(self.movies_list) == 50:
-                    self.load_data(name_index)
-                    self.movies_list.clear()
-            self.load_data(name_index)
-            break
+    def refresh(self, name_index) -> None:
+        """Один refresh после всей загрузки вместо refresh на каждой пачке"""
+        self.client.indices.refresh(index=name_index)
+
+    def notify(self, name_index, ids: Optional[list]) -> None:
+        """Сообщает API об изменениях после refresh: раньше API могло бы прочитать
+        из ES старые документы и снова положить их в кеш. None - изменился весь индекс
+        """
+        if not self.notifier:
+            return
+        if ids is None:
+            self.notifier.publish_reindex(name_index)
+        else:
+            self.notifier.publish(name_index, ids)
+
+    def write(self, docs: list[Doc], name_index) -> tuple[list, dict]:
+        """Один bulk-запрос: id записанных документов и ошибки остальных"""
+        try:
+            return bulk_items(self.client.bulk(body=bulk_body(docs, name_index)))
+        except TransportError as e:
+            return [], chunk_failed(docs, e)
+
+    def load(self, docs: list[Doc], name_index) -> BulkResult:
+        """Пишет пачку документов в ES частями, части уходят одновременно из пула потоков.
+
+        Документы, упавшие из-за сети, перегрузки (429) или ошибки сервера (5xx),
+        повторяются ES_BULK_RETRIES раз с растущей паузой. Если они так и не записаны,
+        бросается BulkError, и пачка не считается загруженной. Документы, которые ES
+        отверг (остальные 4xx), пропускаются: повтор их не исправит
+        """
+        loaded, rejected, pending = [], [], docs
+        for attempt in range(ES_BULK_RETRIES + 1):
+            if attempt:
+                time.sleep(RETRY_SLEEP * 2 ** (attempt - 1))
+            failed = {}
+            for written, errors in self.executor.map(lambda chunk: self.write(chunk, name_index), chunks(pending)):
+                loaded.extend(written)
+                failed.update(errors)
+            retry = to_retry(failed, name_index, rejected)
+            if not retry:
+                break
+            pending = [doc for doc in pending if doc[0] in retry]
+        else:
+            raise BulkError(name_index, retry)
+        return BulkResult(loaded, rejected)
+
+    def close(self) -> None:
+        """Останавливает потоки bulk-запросов и закрывает соединения клиента"""
+        self.executor.shutdown()
+        self.client.close()
@@ -0,0 +1,109 @@
+import abc
+import hashlib
+import sqlite3
+import threading
+from typing import Optional
+
+from redis import Redis
+
+from config import redis_conf, ETL_FINGERPRINTS, ETL_FINGERPRINTS_FILE, ETL_FINGERPRINTS_REDIS_PREFIX
+from transform import Doc
+
+SQLITE_MAX_PARAMS = 900
+
+
+def fingerprint(source: str) -> str:
+    """Короткий хеш готового JSON документа: одинаковые документы сериализуются одинаково"""
+    return hashlib.blake2b(source.encode(), digest_size=8).hexdigest()
+
+
+class BaseFingerprints:
+    """Хеши документов, уже записанных в индекс: id -> fingerprint"""
+    @abc.abstractmethod
+    def get(self, name_index: str, ids: list) -> dict:
+        """Известные хеши для этих id"""
+        pass
+
+    @abc.abstractmethod
+    def put(self, name_index: str, hashes: dict) -> None:
+        """Запомнить хеши записанных документов"""
+        pass
+
+    @abc.abstractmethod
+    def clear(self, name_index: str) -> None:
+        """Забыть все хеши индекса: следующая загрузка запишет документы заново"""
+        pass
+
+    def changed(self, name_index: str, docs: list[Doc]) -> tuple[list[Doc], dict]:
+        """Документы, которые отличаются от записанных, и их новые хеши"""
+        hashes = {_id: fingerprint(source) for _id, source in docs}
+        known = self.get(name_index, list(hashes))
+        changed = [(_id, source) for _id, source in docs if known.get(_id) != hashes[_id]]
+        return changed, {_id: hashes[_id] for _id, _ in changed}
+
+
+class SqliteFingerprints(BaseFingerprints):
+    """Хеши в локальном файле SQLite, одно соединение на все потоки ETL"""
+    def __init__(self, file_path: str):
+        self.conn = sqlite3.connect(file_path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS fingerprints ('
+                'name_index TEXT, id TEXT, hash TEXT, PRIMARY KEY (name_index, id)) WITHOUT ROWID'
+            )
+
+    def get(self, name_index: str, ids: list) -> dict:
+        known = {}
+        with self.lock:
+            # Старые сборки SQLite принимают не больше 999 параметров в запросе
+            for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+                chunk = ids[start:start + SQLITE_MAX_PARAMS]
+                known.update(self.conn.execute(
+                    f'SELECT id, hash FROM fingerprints WHERE name_index = ? AND id IN ({",".join("?" * len(chunk))})',
+                    [name_index, *chunk],
+                ).fetchall())
+        return known
+
+    def put(self, name_index: str, hashes: dict) -> None:
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO fingerprints (name_index, id, hash) VALUES (?, ?, ?)',
+                [(name_index, _id, value) for _id, value in hashes.items()],
+            )
+
+    def clear(self, name_index: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM fingerprints WHERE name_index = ?', (name_index,))
+
+
+class RedisFingerprints(BaseFingerprints):
+    """Хеши индекса в одном хеше Redis"""
+    def __init__(self, redis_conf: dict, prefix: str):
+        self.client = Redis(**redis_conf)
+        self.prefix = prefix
+
+    def key(self, name_index: str) -> str:
+        return f'{self.prefix}{name_index}'
+
+    def get(self, name_index: str, ids: list) -> dict:
+        if not ids:
+            return {}
+        values = self.client.hmget(self.key(name_index), ids)
+        return {_id: value.decode() for _id, value in zip(ids, values) if value is not None}
+
+    def put(self, name_index: str, hashes: dict) -> None:
+        if hashes:
+            self.client.hset(self.key(name_index), mapping=hashes)
+
+    def clear(self, name_index: str) -> None:
+        self.client.delete(self.key(name_index))
+
+
+def get_fingerprints() -> Optional[BaseFingerprints]:
+    """Хранилище хешей из настроек: sqlite (по умолчанию), redis или off - писать все документы"""
+    if ETL_FINGERPRINTS == 'redis':
+        return RedisFingerprints(redis_conf, ETL_FINGERPRINTS_REDIS_PREFIX)
+    if ETL_FINGERPRINTS == 'sqlite':
+        return SqliteFingerprints(ETL_FINGERPRINTS_FILE)
+    return None
@@ -1,44 +1,225 @@
+import argparse
 import psycopg2
 import logging
 
+from bisect import bisect_right
 from datetime import datetime
 from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import DictCursor
 
-from config import dsl, es_conf
-from postgresloader import PostgresLoader
+from changes import ChangeTracker
+from config import dsl, es_conf, redis_conf, CACHE_INVALIDATION_CHANNEL, ETL_QUEUE_SIZE
+from pipeline import run_pipeline
+from postgresloader import Batch, PostgresLoader
+from profiling import profiler
 from utils import backoff
 from es import EsSaver
-from state import State, JsonFileStorage
+from fingerprints import BaseFingerprints, get_fingerprints
+from notifier import CacheNotifier
+from state import State, get_storage
 
 logger = logging.getLogger('LoaderStart')
 
+INDEXES = {
+    'movies': 'schemas_es/schemas_film.json',
+    'genre': 'schemas_es/schemas_genre.json',
+    'person': 'schemas_es/schemas_person.json',
+}
 
-def load_from_postgres(pg_conn: _connection, name_index: str) -> list:
-    """Основной метод загрузки данных из Postgres"""
-    postgres_loader = PostgresLoader(pg_conn)
-    data = getattr(postgres_loader, f'loader_{name_index}')()
-    return data
 
+def marks_key(name_index: str) -> str:
+    """Отметки (updated_at, id) таблиц, уже перенесенных в индекс"""
+    return f'marks:{name_index}'
+
+
+def job_key(name_index: str) -> str:
+    """Начатый перенос индекса: новые отметки и контрольная точка"""
+    return f'job:{name_index}'
+
+
+def job_marks(state: State, name_index: str, job: dict) -> dict:
+    """Отметки, от которых ищутся изменения задания; у полной переиндексации их нет"""
+    return {} if 'target' in job else state.get_state(marks_key(name_index)) or {}
+
+
+def start_job(pg_conn: _connection, saver: EsSaver, state: State, name_index: str, full: bool,
+              fingerprints: Optional[BaseFingerprints] = None) -> tuple[dict, Optional[list]]:
+    """Определяет изменения индекса и сохраняет задание на перенос до начала загрузки.
+
+    При полной переиндексации задание пишет в новую версию индекса (target).
+    Возвращает задание и id документов для переноса
+    """
+    job = {'after': None}
+    if full:
+        job['target'] = saver.create_versioned_index(INDEXES[name_index], alias=name_index)
+    marks = job_marks(state, name_index, job)
+    if fingerprints and not marks:
+        # Индекс пишется с нуля: хеши прошлых загрузок к нему не относятся
+        fingerprints.clear(name_index)
+    changes = ChangeTracker(pg_conn).collect(name_index, marks)
+    job['marks'] = changes.marks
+    state.set_state(job_key(name_index), job)
+    return job, changes.ids
+
+
+def resume_job(pg_conn: _connection, state: State, name_index: str, job: dict) -> Optional[list]:
+    """id документов начатого переноса.
+
+    Список в состоянии не хранится, иначе контрольная точка каждой пачки
+    переписывала бы его целиком: он собирается заново от тех же отметок.
+    В него попадут и изменения, сделанные после начала переноса, но отметки
+    задания остаются прежними, поэтому изменения после них не потеряются
+    """
+    return ChangeTracker(pg_conn).collect(name_index, job_marks(state, name_index, job)).ids
+
+
+def loaded_before(ids: Optional[list], after) -> Optional[set]:
+    """id, которые прерванный запуск мог записать в ES до контрольной точки after.
+
+    Кеш API по ним еще не сброшен. None - перенос всех документов, какие из них
+    записаны, неизвестно, поэтому сбрасывается кеш всего индекса
+    """
+    if after is None:
+        return set()
+    if ids is None:
+        return None
+    return set(ids[:bisect_right(ids, after)])
 
-if __name__ == '__main__':
-    @backoff()
-    def query_postgres_film(name_index) -> list:
-        with closing(psycopg2.connect(**dsl, cursor_factory=DictCursor)) as pg_conn:
-            logger.info(f'{datetime.now()}\n\nPostgreSQL connection is open. Start load {name_index} data')
-            load_pq = load_from_postgres(pg_conn, name_index)
-        return load_pq
 
+def transfer_index(pg_conn: _connection, saver: EsSaver, state: State, name_index: str, full: bool = False,
+                   fingerprints: Optional[BaseFingerprints] = None) -> None:
+    """Переносит один индекс с контрольной точкой после каждой загруженной пачки.
 
-    def save_elastic(schemas: str, name_index: str) -> None:
-        logger.info(f'{datetime.now()}\n\nElasticSearch connection is open. Start load {name_index} data')
-        #EsSaver(es_conf).create_index(schemas, name_index=name_index)
-        EsSaver(es_conf).load(query_postgres_film(name_index), name_index=name_index)
+    Контрольная точка сдвигается только после пачки, записанной целиком (иначе
+    EsSaver.load бросает исключение), отметки индекса - только после всего переноса.
+    Если прошлый запуск прервался, его задание продолжается с последней
+    загруженной пачки.
+    С fingerprints документы, не изменившиеся с прошлой записи, в ES не отправляются.
+    Refresh и сброс кеша API касаются только записанных документов: каждый сброс
+    меняет поколение индекса и обесценивает кеш всех его списков
+    """
+    job = state.get_state(job_key(name_index))
+    target = job and job.get('target')
+    if job is not None and (full and not target or target and not saver.client.indices.exists(index=target)):
+        # Полная переиндексация заменяет начатый обычный перенос; пропавшую версию индекса строим заново
+        state.delete_state(job_key(name_index))
+        job = None
+    if job is None:
+        job, ids = start_job(pg_conn, saver, state, name_index, full, fingerprints)
+    else:
+        ids = resume_job(pg_conn, state, name_index, job)
+        logger.info(f'{datetime.now()}\n\nResume {name_index} transfer after {job["after"]}')
+    target = job.get('target', name_index)
+    skipped, rejected = 0, 0
+    written = loaded_before(ids, job['after'])
 
-    save_elastic(schemas='schemas_es/schemas_film.json', name_index='movies')
-    save_elastic(schemas='schemas_es/schemas_genre.json', name_index='genre')
-    save_elastic(schemas='schemas_es/schemas_person.json', name_index='person')
+    def load(batch: Batch) -> None:
+        nonlocal skipped, rejected
+        docs, hashes = fingerprints.changed(name_index, batch) if fingerprints else (batch, {})
+        skipped += len(batch) - len(docs)
+        if docs:
+            result = saver.load(docs, name_index=target)
+            rejected += len(result.rejected)
+            if written is not None:
+                written.update(result.loaded)
+            if fingerprints:
+                fingerprints.put(name_index, {_id: hashes[_id] for _id in result.loaded})
+        job['after'] = batch.after
+        state.set_state(job_key(name_index), job)
+
+    if ids is None or ids:
+        run_pipeline(
+            PostgresLoader(pg_conn).batches(name_index, ids, job['after']),
+            load,
+            name=name_index,
+            queue_size=ETL_QUEUE_SIZE,
+        )
+        if fingerprints:
+            logger.info(f'{datetime.now()}\n\n{name_index}: {skipped} unchanged documents skipped')
+        if rejected:
+            logger.error(f'{datetime.now()}\n\n{name_index}: {rejected} documents rejected by ES')
+    else:
+        logger.info(f'{datetime.now()}\n\nNo changes for {name_index}')
+
+    if 'target' in job:
+        saver.finish_bulk_load(INDEXES[name_index], target)
+        saver.switch_alias(name_index, target)
+        if saver.notifier:
+            saver.notifier.publish_reindex(name_index)
+    elif written is None or written:
+        saver.refresh(name_index)
+        saver.notify(name_index, None if written is None else sorted(written))
+    state.set_state(marks_key(name_index), job['marks'])
+    state.delete_state(job_key(name_index))
+
+
+@backoff()
+def save_elastic(name_index: str, state: State, full: bool = False,
+                 fingerprints: Optional[BaseFingerprints] = None) -> bool:
+    """Переносит один индекс: у каждого индекса свое соединение с Postgres и ES.
+
+    full - полная переиндексация в новую версию индекса с переключением алиаса,
+    API читает по алиасу и не видит недостроенный индекс
+    """
+    with closing(psycopg2.connect(**dsl, cursor_factory=DictCursor)) as pg_conn:
+        logger.info(f'{datetime.now()}\n\nPostgreSQL connection is open. Start load {name_index} data')
+        notifier = CacheNotifier(redis_conf, CACHE_INVALIDATION_CHANNEL)
+        with closing(EsSaver(es_conf, notifier=notifier)) as saver:
+            transfer_index(pg_conn, saver, state, name_index, full, fingerprints)
+    return True
+
+
+def drop_reindex(name_index: str, state: State) -> None:
+    """Удаляет версию индекса и задание полной переиндексации, которая так и не удалась.
+
+    Если ES недоступен и удалить не получилось, задание остается,
+    и следующий запуск продолжит загрузку в ту же версию
+    """
+    job = state.get_state(job_key(name_index))
+    if not job or 'target' not in job:
+        return
+    try:
+        with closing(EsSaver(es_conf)) as saver:
+            saver.drop_index(job['target'])
+    except Exception as e:
+        logger.error(f'{datetime.now()}\n\nindex {job["target"]} was not dropped: {e!r}')
+        return
+    state.delete_state(job_key(name_index))
+
+
+def run_index(name_index: str, state: State, full: bool = False,
+              fingerprints: Optional[BaseFingerprints] = None) -> None:
+    """save_elastic, после которого не остается брошенных версий индекса.
+
+    Повторы save_elastic продолжают переиндексацию с контрольной точки,
+    версия индекса удаляется, только когда повторы исчерпаны
+    """
+    try:
+        save_elastic(name_index, state, full, fingerprints)
+    except Exception:
+        drop_reindex(name_index, state)
+        raise
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Перенос данных из Postgres в ElasticSearch')
+    parser.add_argument('--full-reindex', action='store_true',
+                        help='перестроить индексы целиком в новые версии и переключить алиасы')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='записать в DIR время стадий по пачкам, сводку прогона и данные cProfile')
+    args = parser.parse_args()
 
-    State(JsonFileStorage('PostgresDataState.txt')).set_state(str('my_key'), value=str(datetime.now()))
+    if args.profile:
+        profiler.enable(args.profile)
+    state = State(get_storage())
+    fingerprints = get_fingerprints()
+    with ThreadPoolExecutor(max_workers=len(INDEXES)) as executor:
+        list(executor.map(
+            lambda name_index: profiler.run(run_index, name_index, state, args.full_reindex, fingerprints),
+            INDEXES,
+        ))
+    profiler.dump()
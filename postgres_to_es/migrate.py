@@ -0,0 +1,35 @@
+import logging
+import os
+from contextlib import closing
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+
+from config import dsl
+
+logger = logging.getLogger('Migrations')
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def apply_migrations(pg_conn: _connection, path: str = MIGRATIONS_DIR) -> None:
+    """Применяет SQL-файлы из migrations по порядку имен.
+
+    Файлы написаны так, что их можно выполнять повторно, поэтому
+    они применяются при каждом старте ETL
+    """
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.sql'):
+            continue
+        with open(os.path.join(path, name), 'r') as file:
+            sql = file.read()
+        with pg_conn.cursor() as cursor:
+            cursor.execute(sql)
+        pg_conn.commit()
+        logger.info(f'{datetime.now()}\n\nmigration {name} applied')
+
+
+if __name__ == '__main__':
+    with closing(psycopg2.connect(**dsl)) as pg_conn:
+        apply_migrations(pg_conn)
@@ -0,0 +1,24 @@
+-- Триггеры будят ETL через NOTIFY при изменении таблиц-источников.
+-- Уведомление шлется один раз на запрос (FOR EACH STATEMENT), а одинаковые
+-- уведомления одной транзакции Postgres сам схлопывает в одно.
+CREATE OR REPLACE FUNCTION content.notify_etl() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('etl_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS film_work_notify_etl ON content.film_work;
+CREATE TRIGGER film_work_notify_etl
+    AFTER INSERT OR UPDATE OR DELETE ON content.film_work
+    FOR EACH STATEMENT EXECUTE PROCEDURE content.notify_etl();
+
+DROP TRIGGER IF EXISTS genre_notify_etl ON content.genre;
+CREATE TRIGGER genre_notify_etl
+    AFTER INSERT OR UPDATE OR DELETE ON content.genre
+    FOR EACH STATEMENT EXECUTE PROCEDURE content.notify_etl();
+
+DROP TRIGGER IF EXISTS person_notify_etl ON content.person;
+CREATE TRIGGER person_notify_etl
+    AFTER INSERT OR UPDATE OR DELETE ON content.person
+    FOR EACH STATEMENT EXECUTE PROCEDURE content.notify_etl();
@@ -0,0 +1,19 @@
+-- Индексы под выборки ETL.
+-- (updated_at, id) - поиск изменений и постраничная выгрузка по этому ключу;
+-- person_id и genre_id - переход от измененных персон и жанров к их фильмам.
+-- Строки без updated_at не попали бы ни в одну выборку по ключу, поэтому им
+-- проставляется время, а у новых строк оно будет по умолчанию.
+UPDATE content.film_work SET updated_at = now() WHERE updated_at IS NULL;
+UPDATE content.person SET updated_at = now() WHERE updated_at IS NULL;
+UPDATE content.genre SET updated_at = now() WHERE updated_at IS NULL;
+
+ALTER TABLE content.film_work ALTER COLUMN updated_at SET DEFAULT now();
+ALTER TABLE content.person ALTER COLUMN updated_at SET DEFAULT now();
+ALTER TABLE content.genre ALTER COLUMN updated_at SET DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS film_work_updated_at_id ON content.film_work (updated_at, id);
+CREATE INDEX IF NOT EXISTS person_updated_at_id ON content.person (updated_at, id);
+CREATE INDEX IF NOT EXISTS genre_updated_at_id ON content.genre (updated_at, id);
+
+CREATE INDEX IF NOT EXISTS person_film_work_person_id ON content.person_film_work (person_id);
+CREATE INDEX IF NOT EXISTS genre_film_work_genre_id ON content.genre_film_work (genre_id);
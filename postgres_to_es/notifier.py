@@ -0,0 +1,44 @@
+import json
+import logging
+
+from redis import Redis
+
+from config import ETL_BATCH_SIZE
+from utils import backoff
+
+
+logger = logging.getLogger('CacheNotifier')
+
+
+def generation_key(name_index: str) -> str:
+    """Поколение индекса: входит в ключи кеша списков и поиска в API"""
+    return f'generation:{name_index}'
+
+
+class CacheNotifier:
+    """Публикует id изменившихся документов, чтобы API сбросило их кеш.
+
+    Каждое сообщение сдвигает поколение индекса: API переводит на новые ключи
+    все списки и поиски индекса, в том числе те, где документа еще не было
+    """
+    def __init__(self, redis_conf: dict, channel: str):
+        self.client = Redis(**redis_conf)
+        self.channel = channel
+
+    @backoff()
+    def publish(self, name_index: str, ids: list) -> None:
+        """Большой список изменений уходит несколькими сообщениями по ETL_BATCH_SIZE id"""
+        for start in range(0, len(ids), ETL_BATCH_SIZE):
+            self.send({'index': name_index, 'ids': [str(i) for i in ids[start:start + ETL_BATCH_SIZE]]})
+        if ids:
+            logger.info(f'Cache invalidation sent for {len(ids)} {name_index} documents')
+
+    @backoff()
+    def publish_reindex(self, name_index: str) -> None:
+        """Индекс полностью перестроен: API должно сбросить весь его кеш"""
+        self.send({'index': name_index, 'ids': [], 'reindex': True})
+        logger.info(f'Cache invalidation sent for the whole {name_index} index')
+
+    def send(self, message: dict) -> None:
+        generation = self.client.incr(generation_key(message['index']))
+        self.client.publish(self.channel, json.dumps(message | {'generation': generation}))
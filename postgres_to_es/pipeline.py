@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from datetime import datetime
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import perf_counter
+from typing import AsyncIterable, Awaitable, Callable, Iterable, Optional
+
+from profiling import profiler
+
+logger = logging.getLogger('Pipeline')
+
+_DONE = object()
+
+
+class StageStats:
+    """Счетчик строк и времени работы одной стадии конвейера"""
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.seconds = 0.0
+
+    def add(self, rows: int, seconds: float) -> None:
+        self.rows += rows
+        self.seconds += seconds
+
+    @property
+    def rate(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.rows} rows in {self.seconds:.2f}s ({self.rate:.0f} rows/s)'
+
+
+def run_pipeline(batches: Iterable[list], load: Callable[[list], None], name: str,
+                 queue_size: int = 4) -> tuple[StageStats, StageStats]:
+    """Выгрузка и загрузка пачек одновременно: выгрузка идет в отдельном потоке
+    и складывает пачки в ограниченную очередь, загрузка разбирает ее в текущем
+    """
+    queue = Queue(maxsize=queue_size)
+    stop = Event()
+    errors = []
+    extract = StageStats('extract')
+    load_stats = StageStats('load')
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            rows = iter(batches)
+            while True:
+                started = perf_counter()
+                batch = next(rows, None)
+                if batch is None:
+                    break
+                extract.add(len(batch), perf_counter() - started)
+                if not put(batch):
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(_DONE)
+
+    producer = Thread(target=profiler.run, args=(produce,), name=f'{name}-extract', daemon=True)
+    producer.start()
+    try:
+        while True:
+            try:
+                batch = queue.get(timeout=1)
+            except Empty:
+                if not producer.is_alive() and queue.empty():
+                    break
+                continue
+            if batch is _DONE:
+                break
+            started = perf_counter()
+            load(batch)
+            seconds = perf_counter() - started
+            load_stats.add(len(batch), seconds)
+            profiler.record(name, 'load', len(batch), seconds)
+    finally:
+        stop.set()
+        producer.join()
+    if errors:
+        raise errors[0]
+    logger.info(f'{datetime.now()}\n\n{name} {extract}; {load_stats}')
+    return extract, load_stats
+
+
+async def run_async_pipeline(batches: AsyncIterable[list], load: Callable[[list], Awaitable[None]], name: str,
+                             queue_size: int = 4, workers: int = 4,
+                             on_loaded: Optional[Callable[[list], Awaitable[None]]] = None,
+                             ) -> tuple[StageStats, StageStats]:
+    """Асинхронный вариант run_pipeline: выгрузка складывает пачки в очередь,
+    а workers загрузчиков пишут их одновременно.
+
+    on_loaded получает пачки строго по порядку выгрузки и только после того,
+    как загружены все предыдущие, - на этом держатся контрольные точки
+    """
+    queue = asyncio.Queue(maxsize=queue_size)
+    extract = StageStats('extract')
+    load_stats = StageStats('load')
+    loaded, next_seq = {}, 0
+    commit = asyncio.Lock()
+
+    async def produce() -> None:
+        seq = 0
+        rows = batches.__aiter__()
+        while True:
+            started = perf_counter()
+            try:
+                batch = await rows.__anext__()
+            except StopAsyncIteration:
+                break
+            extract.add(len(batch), perf_counter() - started)
+            await queue.put((seq, batch))
+            seq += 1
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def consume() -> None:
+        nonlocal next_seq
+        while (item := await queue.get()) is not None:
+            seq, batch = item
+            await load(batch)
+            # Загрузчики работают одновременно, поэтому время стадии - общее время конвейера
+            load_stats.add(len(batch), 0)
+            async with commit:
+                loaded[seq] = batch
+                while next_seq in loaded:
+                    batch = loaded.pop(next_seq)
+                    next_seq += 1
+                    if on_loaded:
+                        await on_loaded(batch)
+
+    started = perf_counter()
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(consume()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    load_stats.seconds = perf_counter() - started
+    logger.info(f'{datetime.now()}\n\n{name} {extract}; {load_stats}')
+    return extract, load_stats
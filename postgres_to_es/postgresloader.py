@@ -1,113 +1,83 @@
-import re
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from uuid import UUID
 
-from psycopg2.extensions import connection as _connection
-from psycopg2.extras import DictCursor
-from state import JsonFileStorage, State
-from db_query import load_person_q, load_film_id, full_load, query_all_genre, load_person_role
-from schemas import Film, Genre, Person
+from psycopg2.extensions import connection as _connection, cursor as TupleCursor
+from config import ETL_BATCH_SIZE
+from prepared import execute
+from profiling import profiler
+from transform import Doc, to_docs
 
 
-class PostgresLoader:
-    """Класс для выгрузки данных из postgres"""
-    def __init__(self, pg_conn: _connection, state_key='my_key'):
-        self.conn = pg_conn
-        self.cursor = self.conn.cursor(cursor_factory=DictCursor)
-        self.batch_size = 100
-        self.key = state_key
-        self.state_key = State(JsonFileStorage('PostgresDataState.txt')).get_state(state_key)
-        self.data = []
-
-    def load_person_id(self) -> str:
-        """Вложенный запрос на получение id персон, думаю функция тут лишняя """
-        return load_person_q
-
-    def load_film_work_id(self) -> str:
-        """Вложенный запрос на получение id film_work"""
-        query = load_film_id % self.load_person_id()
-        if self.state_key is None:
-            return query
-        inx = query.rfind(
-            f'WHERE pfw.person_id IN ({self.load_person_id()})'
-        )
-        return f"{query[:inx]} AND updated_at > '{self.state_key}' {query[inx:]}"
-
-    def load_all_film_work_person(self) -> str:
-        return full_load % self.load_film_work_id()
-
-    def load_genre(self) -> str:
-        if self.state_key is None:
-            return query_all_genre
-        inx = re.search('FROM content.genre', query_all_genre).end()
-        return f"{query_all_genre[:inx]} WHERE updated_at > '{self.state_key}' {query_all_genre[inx:]}"
-
-    def load_person(self) -> str:
-        query = load_person_role
-        if self.state_key is None:
-            return query
-        inx = re.search('as pfw ON p.id = pfw.person_id', query).end()
-        return f"{query[:inx]} WHERE updated_at > '{self.state_key}' {query[inx:]}"
-
-    def loader_movies(self) -> list:
-        """Запрос на получение всех данных по фильмам"""
-        self.cursor.execute(self.load_all_film_work_person())
+class Batch(list):
+    """Пачка документов и контрольная точка: после загрузки пачки выгрузку
+    можно продолжить с after, не повторяя уже загруженное
+    """
+    def __init__(self, docs: list[Doc], after):
+        super().__init__(docs)
+        self.after = after
 
-        while True:
-            rows = self.cursor.fetchmany(self.batch_size)
-            if not rows:
-                break
 
-            for row in rows:
-                d = Film(
-                    id              = dict(row).get('id'),
-                    imdb_rating     = dict(row).get('rating'),
-                    genre           = dict(row).get('genre'),
-                    title           = dict(row).get('title'),
-                    description     = dict(row).get('description'),
-                    director        = dict(row).get('director'),
-                    actors_names    = dict(row).get('actors_names'),
-                    writers_names   = dict(row).get('writers_names'),
-                    actors          = dict(row).get('actors'),
-                    writers         = dict(row).get('writers'),
-                )
-                self.data.append(d.dict())
+# Ключ (updated_at, id), с которого начинается выгрузка всей таблицы
+KEYSET_START = (datetime.min.replace(tzinfo=timezone.utc), str(UUID(int=0)))
 
-        return self.data
 
-    def loader_genre(self) -> list:
-        """Запрос на получение всех жанров"""
-        self.cursor.execute(self.load_genre())
-
-        while True:
-            rows = self.cursor.fetchmany(self.batch_size)
-            if not rows:
-                break
-
-            for row in rows:
-                d = Genre(
-                    id              = dict(row).get('id'),
-                    name            = dict(row).get('name'),
-                    description     = dict(row).get('description'),
-                )
-                self.data.append(d.dict())
-
-        return self.data
-
-    def loader_person(self) -> list:
-        """Запрос на получение всех персон"""
-        self.cursor.execute(self.load_person())
-
-        while True:
-            rows = self.cursor.fetchmany(self.batch_size)
-            if not rows:
-                break
-
-            for row in rows:
-                d = Person(
-                    id              = dict(row).get('id'),
-                    full_name       = dict(row).get('full_name'),
-                    birth_date      = dict(row).get('birth_date'),
-                    role            = dict(row).get('role').replace('{', '').replace('}', ''),
-                    film_ids        = dict(row).get('film_ids').replace('{', '').replace('}', '').split(',')
-                )
-                self.data.append(d.dict())
-        return self.data
+class PostgresLoader:
+    """Класс для выгрузки данных из postgres"""
+    def __init__(self, pg_conn: _connection, batch_size: int = ETL_BATCH_SIZE):
+        self.conn = pg_conn
+        self.batch_size = batch_size
+
+    @staticmethod
+    def fetch(cursor: TupleCursor, name: str, *args) -> list:
+        execute(cursor, name, *args)
+        return cursor.fetchall()
+
+    def fetch_pages(self, name: str, after: Optional[tuple] = None) -> Iterator[list]:
+        """Вся таблица страницами по ключу (updated_at, id): каждая страница - отдельный
+        запрос по индексу, поэтому в памяти клиента не лежит больше одной пачки.
+        Строки - обычные кортежи, первые две колонки - id и updated_at.
+        after - ключ, после которого начинать
+        """
+        after = after or KEYSET_START
+        with self.conn.cursor(cursor_factory=TupleCursor) as cursor:
+            while True:
+                rows = profiler.timed(name, 'query', self.fetch, cursor, f'{name}_page', *after, self.batch_size)
+                if rows:
+                    yield rows
+                if len(rows) < self.batch_size:
+                    return
+                after = (rows[-1][1], rows[-1][0])
+
+    def fetch_by_ids(self, name: str, ids: Optional[list] = None) -> Iterator[list]:
+        """Без ids выгружает всю таблицу, иначе только строки с этими id,
+        запрашивая их по пачкам
+        """
+        if ids is None:
+            yield from self.fetch_pages(name)
+            return
+        with self.conn.cursor(cursor_factory=TupleCursor) as cursor:
+            for start in range(0, len(ids), self.batch_size):
+                execute(cursor, f'{name}_by_ids', ids[start:start + self.batch_size])
+                rows = cursor.fetchall()
+                if rows:
+                    yield rows
+
+    def batches(self, name_index: str, ids: Optional[list] = None, after=None) -> Iterator[Batch]:
+        """Пачки документов индекса с контрольными точками.
+
+        Без ids выгружается вся таблица, after - ключ (updated_at, id) последней
+        загруженной строки. Список ids отсортирован, after - последний загруженный id
+        """
+        if ids is None:
+            for rows in self.fetch_pages(name_index, after and tuple(after)):
+                docs = profiler.timed(name_index, 'transform', to_docs, rows, name_index)
+                yield Batch(docs, [rows[-1][1].isoformat(), rows[-1][0]])
+            return
+        with self.conn.cursor(cursor_factory=TupleCursor) as cursor:
+            for start in range(bisect_right(ids, after) if after else 0, len(ids), self.batch_size):
+                chunk = ids[start:start + self.batch_size]
+                rows = profiler.timed(name_index, 'query', self.fetch, cursor, f'{name_index}_by_ids', chunk)
+                docs = profiler.timed(name_index, 'transform', to_docs, rows, name_index)
+                yield Batch(docs, chunk[-1])
@@ -0,0 +1,24 @@
+import threading
+from weakref import WeakKeyDictionary
+
+from psycopg2.extensions import cursor as _cursor
+
+from db_query import STATEMENTS
+
+# Какие операторы уже подготовлены на каждом соединении. Подготовленный оператор
+# живет, пока живет сессия, поэтому соединения из пула готовят его один раз
+_prepared = WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def execute(cursor: _cursor, name: str, *args) -> None:
+    """Выполняет подготовленный оператор из STATEMENTS, при первом вызове на соединении готовит его"""
+    with _lock:
+        prepared = _prepared.setdefault(cursor.connection, set())
+    types, query = STATEMENTS[name]
+    if name not in prepared:
+        cursor.execute(f'PREPARE {name} {f"({types})" if types else ""} AS {query}')
+        prepared.add(name)
+    # Списки psycopg2 передает как text[], поэтому значения явно приводятся к типам параметров
+    placeholders = ', '.join(f'%s::{type_}' for type_ in types.split(', ')[:len(args)])
+    cursor.execute(f'EXECUTE {name} {f"({placeholders})" if args else ""}', args)
@@ -0,0 +1,119 @@
+import cProfile
+import csv
+import json
+import logging
+import os
+import pstats
+import threading
+from collections import defaultdict
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, Optional
+
+from config import dsl
+
+logger = logging.getLogger('Profiler')
+
+
+class Profiler:
+    """Режим профилирования ETL (load_data.py --profile DIR).
+
+    Стадии пачки: query - запрос в Postgres, transform - сборка документов
+    (словари, orjson, при ETL_VALIDATE - pydantic), load - запись в ES
+    с контрольной точкой.
+
+    Пишет в DIR время каждой стадии по каждой пачке (batches.csv), сводку
+    прогона с документами в секунду по индексам (дописывается в history.jsonl,
+    чтобы видеть скорость между прогонами) и данные cProfile всех потоков
+    ETL (etl.prof, смотреть через python -m pstats или snakeviz).
+    Пока режим выключен, record и run почти ничего не стоят
+    """
+    def __init__(self):
+        self.directory: Optional[str] = None
+        self.lock = threading.Lock()
+        self.samples = []
+        self.profiles = []
+        self.started = datetime.now()
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def enable(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.started = datetime.now()
+
+    def record(self, name_index: str, stage: str, rows: int, seconds: float) -> None:
+        """Время одной стадии одной пачки. Стадии индекса проходят пачки по порядку,
+        поэтому n-я запись стадии относится к n-й пачке
+        """
+        if self.enabled:
+            with self.lock:
+                self.samples.append((name_index, stage, rows, seconds))
+
+    def timed(self, name_index: str, stage: str, func: Callable, *args):
+        """Результат func(*args) - список строк или документов пачки - с записью времени стадии"""
+        if not self.enabled:
+            return func(*args)
+        started = perf_counter()
+        result = func(*args)
+        self.record(name_index, stage, len(result), perf_counter() - started)
+        return result
+
+    def run(self, func: Callable, *args, **kwargs):
+        """Вызывает func под cProfile: профилировщик видит только свой поток,
+        поэтому им оборачивается работа каждого потока ETL
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            with self.lock:
+                self.profiles.append(profile)
+
+    def summary(self, seconds: float) -> dict:
+        stages = defaultdict(lambda: {'batches': 0, 'rows': 0, 'seconds': 0.0})
+        for name_index, stage, rows, spent in self.samples:
+            total = stages[f'{name_index}.{stage}']
+            total['batches'] += 1
+            total['rows'] += rows
+            total['seconds'] += spent
+        docs = {key[:-len('.load')]: stats['rows'] for key, stats in stages.items() if key.endswith('.load')}
+        return {
+            'started': self.started.isoformat(),
+            'database': dsl['dbname'],
+            'seconds': seconds,
+            'docs': docs,
+            'docs_per_second': sum(docs.values()) / seconds if seconds else 0.0,
+            'stages': dict(stages),
+        }
+
+    def dump(self) -> None:
+        if not self.enabled:
+            return
+        seconds = (datetime.now() - self.started).total_seconds()
+        with open(os.path.join(self.directory, 'batches.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('index', 'stage', 'batch', 'rows', 'seconds'))
+            numbers = defaultdict(int)
+            for name_index, stage, rows, spent in self.samples:
+                writer.writerow((name_index, stage, numbers[name_index, stage], rows, f'{spent:.6f}'))
+                numbers[name_index, stage] += 1
+        summary = self.summary(seconds)
+        with open(os.path.join(self.directory, 'history.jsonl'), 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+        if self.profiles:
+            stats = pstats.Stats(*self.profiles)
+            stats.dump_stats(os.path.join(self.directory, 'etl.prof'))
+        for key, stats in sorted(summary['stages'].items()):
+            rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+            logger.info(f'{datetime.now()}\n\n{key}: {stats["batches"]} batches, {stats["rows"]} rows '
+                        f'in {stats["seconds"]:.2f}s ({rate:.0f} rows/s)')
+        logger.info(f'{datetime.now()}\n\n{sum(summary["docs"].values())} documents in {seconds:.2f}s '
+                    f'({summary["docs_per_second"]:.0f} docs/s), profile written to {self.directory}')
+
+
+profiler = Profiler()
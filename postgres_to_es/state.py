@@ -1,9 +1,16 @@
 import abc
 import json
 import logging
+import os
+import tempfile
+import threading
 from json import JSONDecodeError
 from typing import Optional, Any
 
+from redis import Redis
+
+from config import redis_conf, ETL_STATE_FILE, ETL_STATE_STORAGE, ETL_STATE_REDIS_KEY
+
 
 class BaseStorage:
     @abc.abstractmethod
@@ -22,11 +29,24 @@ class JsonFileStorage(BaseStorage):
         self.file_path = file_path
 
     def save_state(self, state: dict) -> None:
+        """Пишет состояние во временный файл рядом и подменяет им старый.
+
+        Замена файла атомарна, поэтому после падения на диске лежит либо
+        прежнее, либо новое состояние, но не обрезанный файл
+        """
         if self.file_path is None:
             return
 
-        with open(self.file_path, 'w') as f:
-            json.dump(state, f)
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.state-', delete=False) as f:
+            try:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, self.file_path)
 
     def retrieve_state(self) -> dict:
         if self.file_path is None:
@@ -43,6 +63,32 @@ class JsonFileStorage(BaseStorage):
 
         except FileNotFoundError:
             self.save_state({})
+            return {}
+
+        except JSONDecodeError:
+            logging.error(f'State file {self.file_path} is damaged. Continue with empty state')
+            return {}
+
+
+class RedisStorage(BaseStorage):
+    """Состояние целиком в одном ключе Redis: SET заменяет значение атомарно"""
+    def __init__(self, redis_conf: dict, key: str):
+        self.client = Redis(**redis_conf)
+        self.key = key
+
+    def save_state(self, state: dict) -> None:
+        self.client.set(self.key, json.dumps(state))
+
+    def retrieve_state(self) -> dict:
+        data = self.client.get(self.key)
+        return json.loads(data) if data else {}
+
+
+def get_storage() -> BaseStorage:
+    """Хранилище состояния из настроек: файл (по умолчанию) или Redis"""
+    if ETL_STATE_STORAGE == 'redis':
+        return RedisStorage(redis_conf, ETL_STATE_REDIS_KEY)
+    return JsonFileStorage(ETL_STATE_FILE)
 
 
 class State:
@@ -50,6 +96,8 @@ class State:
     def __init__(self, storage: BaseStorage):
         self.storage = storage
         self.state = self.retrieve_state()
+        # Индексы переносятся в нескольких потоках и сохраняют состояние независимо
+        self.lock = threading.Lock()
 
     def retrieve_state(self) -> dict:
         data = self.storage.retrieve_state()
@@ -59,9 +107,16 @@ class State:
 
     def set_state(self, key: str, value: Any) -> None:
         """Установить состояние для определённого ключа"""
-        self.state[key] = value
+        with self.lock:
+            self.state[key] = value
+
+            self.storage.save_state(self.state)
 
-        self.storage.save_state(self.state)
+    def delete_state(self, key: str) -> None:
+        """Удалить состояние для определённого ключа"""
+        with self.lock:
+            if self.state.pop(key, None) is not None:
+                self.storage.save_state(self.state)
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу"""
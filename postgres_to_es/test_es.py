@@ -0,0 +1,111 @@
+import pytest
+from elasticsearch import ConnectionError as EsConnectionError
+
+import es
+from es import BulkError, EsSaver, chunks, is_retryable
+
+
+def make_docs(*ids, size=10) -> list:
+    return [(_id, '{' + 'x' * (size - 2) + '}') for _id in ids]
+
+
+def test_chunks_by_document_count():
+    docs = make_docs(*'abcde')
+    assert [[_id for _id, _ in chunk] for chunk in chunks(docs, chunk_size=2, max_bytes=1000)] == [
+        ['a', 'b'], ['c', 'd'], ['e']]
+
+
+def test_chunks_by_bytes():
+    docs = make_docs(*'abcde', size=10)
+    assert [len(chunk) for chunk in chunks(docs, chunk_size=100, max_bytes=25)] == [2, 2, 1]
+
+
+def test_chunks_oversized_document_goes_alone():
+    docs = make_docs('a') + make_docs('big', size=100) + make_docs('b')
+    assert [[_id for _id, _ in chunk] for chunk in chunks(docs, chunk_size=100, max_bytes=50)] == [
+        ['a'], ['big'], ['b']]
+
+
+def test_chunks_of_nothing():
+    assert list(chunks([], chunk_size=2, max_bytes=10)) == []
+
+
+@pytest.mark.parametrize('status, retryable', [
+    (429, True), (500, True), (503, True), ('N/A', True), (None, True),
+    (400, False), (404, False), (409, False),
+])
+def test_is_retryable(status, retryable):
+    assert is_retryable(status) is retryable
+
+
+class FakeClient:
+    """bulk отвечает по сценарию: statuses[попытка][id] - статус документа, по умолчанию 201"""
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = []
+
+    def bulk(self, body):
+        ids = [action['index']['_id'] for action in body[::2]]
+        self.calls.append(ids)
+        statuses = self.statuses[len(self.calls) - 1] if len(self.calls) <= len(self.statuses) else {}
+        if statuses == 'down':
+            raise EsConnectionError('N/A', 'connection refused', None)
+        return {'items': [{'index': {'_id': _id, 'status': statuses.get(_id, 201), 'error': 'error'}}
+                          for _id in ids]}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def saver(monkeypatch):
+    monkeypatch.setattr(es, 'RETRY_SLEEP', 0)
+    monkeypatch.setattr(es, 'ES_BULK_RETRIES', 2)
+    saver = EsSaver([{'host': 'localhost', 'port': 9200}])
+    yield saver
+    saver.close()
+
+
+def test_load_writes_all_documents(saver):
+    saver.client = FakeClient()
+    result = saver.load(make_docs(*'abc'), 'movies')
+    assert sorted(result.loaded) == ['a', 'b', 'c']
+    assert result.rejected == []
+    assert saver.client.calls == [['a', 'b', 'c']]
+
+
+def test_load_retries_only_failed_documents(saver):
+    saver.client = FakeClient({'b': 429, 'c': 503}, {'c': 500})
+    result = saver.load(make_docs(*'abcd'), 'movies')
+    assert sorted(result.loaded) == ['a', 'b', 'c', 'd']
+    assert saver.client.calls == [['a', 'b', 'c', 'd'], ['b', 'c'], ['c']]
+
+
+def test_load_retries_a_failed_request(saver):
+    saver.client = FakeClient('down')
+    result = saver.load(make_docs(*'ab'), 'movies')
+    assert sorted(result.loaded) == ['a', 'b']
+    assert saver.client.calls == [['a', 'b'], ['a', 'b']]
+
+
+def test_load_skips_rejected_documents(saver):
+    saver.client = FakeClient({'b': 400})
+    result = saver.load(make_docs(*'abc'), 'movies')
+    assert sorted(result.loaded) == ['a', 'c']
+    assert result.rejected == ['b']
+    assert len(saver.client.calls) == 1
+
+
+def test_load_raises_when_retries_run_out(saver):
+    saver.client = FakeClient({'b': 429}, {'b': 429}, {'b': 503})
+    with pytest.raises(BulkError) as error:
+        saver.load(make_docs(*'abc'), 'movies')
+    assert list(error.value.failed) == ['b']
+    assert saver.client.calls == [['a', 'b', 'c'], ['b'], ['b']]
+
+
+def test_load_raises_when_es_stays_down(saver):
+    saver.client = FakeClient('down', 'down', 'down')
+    with pytest.raises(BulkError) as error:
+        saver.load(make_docs(*'ab'), 'movies')
+    assert sorted(error.value.failed) == ['a', 'b']
@@ -0,0 +1,123 @@
+from bisect import bisect_right
+
+import pytest
+
+import load_data
+from changes import Changes
+from es import BulkResult
+from load_data import job_key, loaded_before, marks_key, transfer_index
+from postgresloader import Batch
+from state import JsonFileStorage, State
+
+IDS = ['a', 'b', 'c', 'd', 'e']
+NEW_MARKS = {'film_work': {'updated_at': '2021-06-16T20:14:09+00:00', 'id': 'e'}}
+
+
+class FakeTracker:
+    def __init__(self, pg_conn):
+        pass
+
+    def collect(self, name_index, marks):
+        return Changes(IDS, NEW_MARKS)
+
+
+class FakeLoader:
+    """Пачки по два id, как PostgresLoader.batches: после after выгрузка продолжается"""
+    starts = []
+
+    def __init__(self, pg_conn):
+        pass
+
+    def batches(self, name_index, ids, after=None):
+        self.starts.append(after)
+        for start in range(bisect_right(ids, after) if after else 0, len(ids), 2):
+            chunk = ids[start:start + 2]
+            yield Batch([(_id, '{}') for _id in chunk], chunk[-1])
+
+
+class FakeSaver:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.loaded, self.refreshed, self.notified = [], [], []
+        self.notifier = None
+
+    def load(self, docs, name_index):
+        ids = [_id for _id, _ in docs]
+        if self.fail_on in ids:
+            raise ConnectionError('ES is down')
+        self.loaded.extend(ids)
+        return BulkResult(ids, [])
+
+    def refresh(self, name_index):
+        self.refreshed.append(name_index)
+
+    def notify(self, name_index, ids):
+        self.notified.append(ids)
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    monkeypatch.setattr(load_data, 'ChangeTracker', FakeTracker)
+    monkeypatch.setattr(load_data, 'PostgresLoader', FakeLoader)
+    FakeLoader.starts = []
+    return State(JsonFileStorage(str(tmp_path / 'state.json')))
+
+
+def test_transfer_commits_marks_and_drops_job(state):
+    saver = FakeSaver()
+    transfer_index(None, saver, state, 'movies')
+    assert saver.loaded == IDS
+    assert saver.notified == [IDS]
+    assert state.get_state(marks_key('movies')) == NEW_MARKS
+    assert state.get_state(job_key('movies')) is None
+
+
+def test_failed_transfer_keeps_checkpoint_of_last_batch(state):
+    saver = FakeSaver(fail_on='c')
+    with pytest.raises(ConnectionError):
+        transfer_index(None, saver, state, 'movies')
+    assert saver.loaded == ['a', 'b']
+    assert saver.notified == []
+    assert state.get_state(job_key('movies')) == {'after': 'b', 'marks': NEW_MARKS}
+    assert state.get_state(marks_key('movies')) is None
+
+
+def test_transfer_resumes_from_saved_after(state, tmp_path):
+    with pytest.raises(ConnectionError):
+        transfer_index(None, FakeSaver(fail_on='c'), state, 'movies')
+
+    restarted = State(JsonFileStorage(str(tmp_path / 'state.json')))
+    saver = FakeSaver()
+    transfer_index(None, saver, restarted, 'movies')
+    assert FakeLoader.starts == [None, 'b']
+    assert saver.loaded == ['c', 'd', 'e']
+    # Документы прерванного запуска тоже сбрасываются в кеше API
+    assert saver.notified == [IDS]
+    assert restarted.get_state(marks_key('movies')) == NEW_MARKS
+    assert restarted.get_state(job_key('movies')) is None
+
+
+def test_nothing_written_is_not_refreshed(state):
+    class Unchanged:
+        def clear(self, name_index):
+            pass
+
+        def changed(self, name_index, batch):
+            return [], {}
+
+    saver = FakeSaver()
+    transfer_index(None, saver, state, 'movies', fingerprints=Unchanged())
+    assert saver.loaded == []
+    assert saver.refreshed == saver.notified == []
+    assert state.get_state(marks_key('movies')) == NEW_MARKS
+
+
+@pytest.mark.parametrize('ids, after, expected', [
+    (IDS, None, set()),
+    (IDS, 'b', {'a', 'b'}),
+    (IDS, 'e', set(IDS)),
+    (None, None, set()),
+    (None, ['2021-06-16T20:14:09+00:00', 'b'], None),
+])
+def test_loaded_before(ids, after, expected):
+    assert loaded_before(ids, after) == expected
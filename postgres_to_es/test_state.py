@@ -0,0 +1,47 @@
+from state import JsonFileStorage, State
+
+
+def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / 'state.json')
+    state = State(JsonFileStorage(path))
+    state.set_state('job:movies', {'after': 'b1f2', 'marks': {'film_work': {'id': 'b1f2'}}})
+    state.set_state('marks:genre', {'genre': {'id': 'a0'}})
+
+    restarted = State(JsonFileStorage(path))
+    assert restarted.get_state('job:movies') == {'after': 'b1f2', 'marks': {'film_work': {'id': 'b1f2'}}}
+    assert restarted.get_state('marks:genre') == {'genre': {'id': 'a0'}}
+
+
+def test_delete_state(tmp_path):
+    path = str(tmp_path / 'state.json')
+    state = State(JsonFileStorage(path))
+    state.set_state('job:movies', {'after': None})
+    state.delete_state('job:movies')
+    state.delete_state('job:missing')
+    assert State(JsonFileStorage(path)).get_state('job:movies') is None
+
+
+def test_missing_state_file_is_created(tmp_path):
+    path = tmp_path / 'state.json'
+    assert State(JsonFileStorage(str(path))).state == {}
+    assert path.read_text() == '{}'
+
+
+def test_damaged_state_file_gives_empty_state(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text('{"job:movies": {"after"')
+    assert State(JsonFileStorage(str(path))).state == {}
+
+
+def test_save_replaces_file_without_leftovers(tmp_path):
+    path = tmp_path / 'state.json'
+    state = State(JsonFileStorage(str(path)))
+    for after in range(3):
+        state.set_state('job:movies', {'after': after})
+    assert [p.name for p in tmp_path.iterdir()] == ['state.json']
+
+
+def test_state_without_file_lives_in_memory():
+    state = State(JsonFileStorage())
+    state.set_state('job:movies', {'after': 'b1f2'})
+    assert state.get_state('job:movies') == {'after': 'b1f2'}
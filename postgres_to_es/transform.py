@@ -0,0 +1,67 @@
+from typing import Callable, Iterable
+
+import orjson
+from pydantic import BaseModel
+
+from config import ETL_VALIDATE
+from schemas import Film, Genre, Person
+
+# Документ для ES: id и готовый JSON. Он сериализуется один раз здесь и дальше
+# вставляется в тело bulk-запроса без изменений
+Doc = tuple[str, str]
+
+
+def film(row: tuple) -> dict:
+    _id, _updated_at, title, description, rating, genre, director, actors, writers, actors_names, writers_names = row
+    return {
+        'id': _id,
+        'imdb_rating': rating,
+        'genre': genre,
+        'title': title,
+        'description': description,
+        'director': director,
+        'actors_names': actors_names,
+        'writers_names': writers_names,
+        'actors': actors,
+        'writers': writers,
+    }
+
+
+def genre(row: tuple) -> dict:
+    _id, _updated_at, name, description = row
+    return {'id': _id, 'name': name, 'description': description}
+
+
+def person(row: tuple) -> dict:
+    _id, _updated_at, full_name, birth_date, roles, film_ids = row
+    return {
+        'id': _id,
+        'full_name': full_name,
+        'birth_date': birth_date,
+        'role': ','.join(roles) if roles else None,
+        'film_ids': film_ids or [],
+    }
+
+
+# Строка запроса -> документ и pydantic-модель для проверки в отладочном режиме
+TRANSFORMS: dict[str, tuple[Callable[[tuple], dict], type[BaseModel]]] = {
+    'movies': (film, Film),
+    'genre': (genre, Genre),
+    'person': (person, Person),
+}
+
+
+def to_docs(rows: Iterable[tuple], name_index: str, validate: bool = ETL_VALIDATE) -> list[Doc]:
+    """Строки из Postgres (кортежи) в документы индекса.
+
+    С validate каждый документ дополнительно проходит через pydantic-модель
+    из schemas.py, и расхождение с моделью считается ошибкой
+    """
+    build, model = TRANSFORMS[name_index]
+    docs = []
+    for row in rows:
+        doc = build(row)
+        if validate and model(**doc).dict() != doc:
+            raise ValueError(f'Document {doc["id"]} of {name_index} does not match {model.__name__}')
+        docs.append((doc['id'], orjson.dumps(doc).decode()))
+    return docs
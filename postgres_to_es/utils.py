@@ -1,34 +1,58 @@
+import asyncio
 import time
 import logging
 from datetime import datetime
 from functools import wraps
 
 
-def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=3):
+def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=3, max_tries=10):
+    """Повторяет функцию с растущей паузой. После max_tries неудачных попыток
+    пробрасывает последнюю ошибку: вызывающий код не должен считать работу сделанной
+    """
 
     def func_wrapper(func):
         @wraps(func)
         def inner(*args, **kwargs):
             t = start_sleep_time
-            count = 0
-            while True:
+            for count in range(1, max_tries + 1):
                 try:
                     return func(*args, **kwargs)
-                except Exception:
+                except Exception as e:
+                    logging.error(f'{datetime.now()}\n\n{e!r} \n\n Попытка подключение №{count}')
+                    if count == max_tries:
+                        logging.error(
+                            f'{datetime.now()}\n\nИсчерпано максимальное количество подключений={max_tries}'
+                        )
+                        raise
                     time.sleep(t)
-                    if t >= border_sleep_time:
-                        t = border_sleep_time
-                    if t < border_sleep_time:
-                        t *= factor
-                    logging.error(f'{datetime.now()}\n\n{Exception} \n\n Попытка подключение №{count}')
-                    count += 1
-                    continue
-                finally:
-                    if count == 10:
-                        logging.info(
-                            f'{datetime.now()}\n\nИсчерпано максимальное количество подключений={count}.\n В другой раз повезет'
+                    t = min(t * factor, border_sleep_time)
+
+        return inner
+
+    return func_wrapper
+
+
+def async_backoff(start_sleep_time=0.1, factor=2, border_sleep_time=3, max_tries=10):
+    """То же, что backoff, но для корутин: пауза через asyncio.sleep не останавливает
+    остальные задачи цикла событий. После max_tries неудачных попыток ошибка пробрасывается
+    """
+
+    def func_wrapper(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            t = start_sleep_time
+            for count in range(1, max_tries + 1):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    logging.error(f'{datetime.now()}\n\n{e!r} \n\n Попытка подключение №{count}')
+                    if count == max_tries:
+                        logging.error(
+                            f'{datetime.now()}\n\nИсчерпано максимальное количество подключений={max_tries}'
                         )
-                        break
+                        raise
+                    await asyncio.sleep(t)
+                    t = min(t * factor, border_sleep_time)
 
         return inner
 
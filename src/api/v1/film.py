@@ -1,18 +1,24 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
+from api.v1.responses import JSONBytesResponse, json_list, page_response
+from core import config
 from models.models import Film, FilmShort
+from services.base import InvalidCursor, InvalidFields
 from services.film import FilmService, get_film_service
 
 router = APIRouter()
 
 
-@router.get('/', response_model=list[Film], response_model_exclude_unset=True)
+@router.get('/', response_model=list[FilmShort],
+            response_model_exclude_unset=True)
 async def films_sorted(sort: str = None,
                        filter_genre: str = None,
                        page_number: int = 0,
                        page_size: int = 20,
+                       cursor: str = None,
+                       fields: str = None,
                        film_service: FilmService = Depends(get_film_service)):
     if not sort:
         sort_field = 'imdb_rating'
@@ -23,78 +29,102 @@ async def films_sorted(sort: str = None,
             raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                                 detail='sorting not found')
         sort_type = 'desc' if sort.startswith('-') else 'asc'
-    film_list = await film_service.get_film_sorted(
-        sort_field=sort_field,
-        sort_type=sort_type,
-        filter_genre=filter_genre,
-        page_number=page_number,
-        page_size=page_size)
+    try:
+        film_list = await film_service.get_film_sorted(
+            sort_field=sort_field,
+            sort_type=sort_type,
+            filter_genre=filter_genre,
+            page_number=page_number,
+            page_size=page_size,
+            cursor=cursor,
+            fields=fields)
+    except InvalidCursor:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail='invalid cursor')
+    except InvalidFields as unknown:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'unknown fields: {unknown}')
     if not film_list:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='film not found')
-    return [FilmShort(id=film.id,
-                      title=film.title,
-                      imdb_rating=film.imdb_rating) for film in film_list]
+    return page_response(film_list)
 
 
 @router.get('/search/{film_search_string}', response_model=list[FilmShort],
             response_model_exclude_unset=True)
 async def films_search(film_search_string: str,
+                       fields: str = None,
                        film_service: FilmService = Depends(
-                           get_film_service)) -> list[FilmShort]:
-    film_list = await film_service.get_film_by_search(film_search_string)
+                           get_film_service)) -> JSONBytesResponse:
+    try:
+        film_list = await film_service.get_film_by_search(
+            film_search_string, fields=fields)
+    except InvalidFields as unknown:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'unknown fields: {unknown}')
     if not film_list:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='film not found')
-    return [FilmShort(id=film.id,
-                      title=film.title,
-                      imdb_rating=film.imdb_rating) for film in film_list]
+    return JSONBytesResponse(film_list)
+
+
+@router.get('/bulk', response_model=list[Film],
+            response_model_exclude_unset=True)
+async def film_bulk(ids: list[str] = Query(...),
+                    film_service: FilmService = Depends(
+                        get_film_service)) -> JSONBytesResponse:
+    if len(ids) > config.BULK_MAX_IDS:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'no more than {config.BULK_MAX_IDS} ids')
+    film_list = await film_service.get_films_by_ids(ids)
+    if not film_list:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail='films not found')
+    return JSONBytesResponse(json_list(film_list))
 
 
 @router.get('/{film_id}', response_model=Film,
             response_model_exclude_unset=True)
 async def film_details(film_id: str,
                        film_service: FilmService = Depends(
-                           get_film_service)) -> Film:
+                           get_film_service)) -> JSONBytesResponse:
     film = await film_service.get_film_by_id(film_id)
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='film not found')
-    return Film(id=film.id,
-                imdb_rating=film.imdb_rating,
-                genre=film.genre,
-                title=film.title,
-                description=film.description,
-                director=film.director,
-                actors_names=film.actors_names,
-                writers_names=film.writers_names,
-                actors=film.actors,
-                writers=film.writers)
+    return JSONBytesResponse(film)
 
 
 @router.get('/{film_id}/alike', response_model=list[FilmShort],
             response_model_exclude_unset=True)
 async def film_alike(film_id: str,
+                     fields: str = None,
                      film_service: FilmService = Depends(
-                         get_film_service)) -> list[FilmShort]:
-    film_list = await film_service.get_film_alike(film_id)
+                         get_film_service)) -> JSONBytesResponse:
+    try:
+        film_list = await film_service.get_film_alike(film_id, fields=fields)
+    except InvalidFields as unknown:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'unknown fields: {unknown}')
     if not film_list:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='film alike not found')
-    return [FilmShort(id=film.id,
-                      title=film.title,
-                      imdb_rating=film.imdb_rating) for film in film_list]
+    return JSONBytesResponse(film_list)
 
 
 @router.get('/genre/{genre_id}', response_model=list[FilmShort],
             response_model_exclude_unset=True)
 async def popular_in_genre(genre_id: str,
+                           fields: str = None,
                            film_service: FilmService = Depends(
-                               get_film_service)) -> list[FilmShort]:
-    film_list = await film_service.get_popular_in_genre(genre_id)
+                               get_film_service)) -> JSONBytesResponse:
+    try:
+        film_list = await film_service.get_popular_in_genre(
+            genre_id, fields=fields)
+    except InvalidFields as unknown:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'unknown fields: {unknown}')
     if not film_list:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='film alike not found')
-    return [FilmShort(id=film.id,
-                      title=film.title,
-                      imdb_rating=film.imdb_rating) for film in film_list]
+    return JSONBytesResponse(film_list)
@@ -1,39 +1,51 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
+from api.v1.responses import JSONBytesResponse, json_list
+from core import config
 from models.models import Genre
 from services.genre import GenreService, get_genre_service
 
 router = APIRouter()
 
 
+@router.get('/bulk', response_model=list[Genre],
+            response_model_exclude_unset=True)
+async def genre_bulk(ids: list[str] = Query(...),
+                     genre_service: GenreService = Depends(
+                         get_genre_service)) -> JSONBytesResponse:
+    if len(ids) > config.BULK_MAX_IDS:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'no more than {config.BULK_MAX_IDS} ids')
+    genre_list = await genre_service.get_by_ids(ids)
+    if not genre_list:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail='genres not found')
+    return JSONBytesResponse(json_list(genre_list))
+
+
 @router.get('/{genre_id}', response_model=Genre,
             response_model_exclude_unset=True)
 async def genre_details(genre_id: str,
                         genre_service: GenreService = Depends(
-                            get_genre_service)) -> Genre:
+                            get_genre_service)) -> JSONBytesResponse:
     genre = await genre_service.get_by_id(genre_id)
     if not genre:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='genre not found')
-    return Genre(id=genre.id,
-                 name=genre.name,
-                 description=genre.description
-                 )
+    return JSONBytesResponse(genre)
 
 
 @router.get('/', response_model=list[Genre], response_model_exclude_unset=True)
 async def genre_list(
         page_number: int = 0,
         page_size: int = 50,
-        genre_service: GenreService = Depends(get_genre_service)) -> list[
-    Genre]:
+        genre_service: GenreService = Depends(
+            get_genre_service)) -> JSONBytesResponse:
     genre_list = await genre_service.get_genre_list(page_number=page_number,
                                                     page_size=page_size)
     if not genre_list:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='genres not found')
-    return [Genre(id=genre.id,
-                  name=genre.name,
-                  description=genre.description) for genre in genre_list]
+    return JSONBytesResponse(genre_list)
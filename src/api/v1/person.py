@@ -1,27 +1,41 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
+from api.v1.responses import JSONBytesResponse, json_list, page_response
+from core import config
 from models.models import Person
+from services.base import InvalidCursor, InvalidFields
 from services.person import PersonService, get_person_service
 
 router = APIRouter()
 
 
+@router.get('/bulk', response_model=list[Person],
+            response_model_exclude_unset=True)
+async def person_bulk(ids: list[str] = Query(...),
+                      person_service: PersonService = Depends(
+                          get_person_service)) -> JSONBytesResponse:
+    if len(ids) > config.BULK_MAX_IDS:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'no more than {config.BULK_MAX_IDS} ids')
+    person_list = await person_service.get_by_ids(ids)
+    if not person_list:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail='persons not found')
+    return JSONBytesResponse(json_list(person_list))
+
+
 @router.get('/{person_id}', response_model=Person,
             response_model_exclude_unset=True)
 async def person_details(person_id: str,
                          person_service: PersonService = Depends(
-                             get_person_service)) -> Person:
+                             get_person_service)) -> JSONBytesResponse:
     person = await person_service.get_by_id(person_id)
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='person not found')
-    return Person(id=person.id,
-                  full_name=person.full_name,
-                  birth_date=person.birth_date,
-                  role=person.role,
-                  film_ids=person.film_ids)
+    return JSONBytesResponse(person)
 
 
 @router.get('/', response_model=list[Person],
@@ -29,31 +43,39 @@ async def person_details(person_id: str,
 async def person_list(
         page_number: int = 0,
         page_size: int = 20,
-        person_service: PersonService = Depends(get_person_service)) -> list[
-    Person]:
-    person_list = await person_service.get_person_list(page_number=page_number,
-                                                       page_size=page_size)
+        cursor: str = None,
+        fields: str = None,
+        person_service: PersonService = Depends(
+            get_person_service)) -> JSONBytesResponse:
+    try:
+        person_list = await person_service.get_person_list(
+            page_number=page_number, page_size=page_size, cursor=cursor,
+            fields=fields)
+    except InvalidCursor:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail='invalid cursor')
+    except InvalidFields as unknown:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'unknown fields: {unknown}')
     if not person_list:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='persons not found')
-    return [Person(id=person.id,
-                   full_name=person.full_name,
-                   birth_date=person.birth_date,
-                   role=person.role,
-                   film_ids=person.film_ids) for person in person_list]
+    return page_response(person_list)
 
 
 @router.get('/search/{person_search_string}', response_model=list[Person],
             response_model_exclude_unset=True)
 async def films_search(person_search_string: str,
+                       fields: str = None,
                        person_service: PersonService = Depends(
-                           get_person_service)) -> list[Person]:
-    person_list = await person_service.get_by_search(person_search_string)
+                           get_person_service)) -> JSONBytesResponse:
+    try:
+        person_list = await person_service.get_by_search(
+            person_search_string, fields=fields)
+    except InvalidFields as unknown:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f'unknown fields: {unknown}')
     if not person_list:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='person not found')
-    return [Person(id=person.id,
-                   full_name=person.full_name,
-                   birth_date=person.birth_date,
-                   role=person.role,
-                   film_ids=person.film_ids) for person in person_list]
+    return JSONBytesResponse(person_list)
@@ -0,0 +1,25 @@
+from fastapi.responses import Response
+
+from services.cache import Cached
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class JSONBytesResponse(Response):
+    """Response for bodies that are already serialized to JSON.
+
+    Unlike ORJSONResponse it sends the content as is, so cached payloads
+    are not parsed and dumped again.
+    """
+    media_type = 'application/json'
+
+
+def json_list(payloads: list[bytes]) -> bytes:
+    """Join serialized JSON documents into a JSON array."""
+    return b'[' + b','.join(payloads) + b']'
+
+
+def page_response(page: Cached) -> JSONBytesResponse:
+    """Send a page of a listing with the cursor of the next page."""
+    headers = {NEXT_CURSOR_HEADER: page.cursor} if page.cursor else None
+    return JSONBytesResponse(page.payload, headers=headers)
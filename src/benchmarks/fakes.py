@@ -0,0 +1,202 @@
+"""In-process stand-ins for Redis and Elasticsearch with optional latency.
+
+They implement only the calls the services make, which is enough to drive
+the API without any backing store.
+"""
+import asyncio
+import random
+import uuid
+from typing import Optional
+
+from elasticsearch import NotFoundError
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+        return command
+
+    async def execute(self) -> list:
+        await self.redis.wait()
+        results = []
+        for name, args, kwargs in self.commands:
+            results.append(await getattr(self.redis, f'_{name}')(
+                *args, **kwargs))
+        self.commands.clear()
+        return results
+
+
+class FakeRedis:
+    SET_IF_NOT_EXIST = 'SET_IF_NOT_EXIST'
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data: dict[str, bytes] = {}
+
+    async def wait(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def pipeline(self) -> FakePipeline:
+        return FakePipeline(self)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        command = getattr(self, f'_{name}')
+
+        async def call(*args, **kwargs):
+            await self.wait()
+            return await command(*args, **kwargs)
+        return call
+
+    async def _get(self, key: str) -> Optional[bytes]:
+        return self.data.get(key)
+
+    async def _mget(self, key: str, *keys: str) -> list[Optional[bytes]]:
+        return [self.data.get(k) for k in (key, *keys)]
+
+    async def _set(self, key: str, value, expire: int = 0, pexpire: int = 0,
+                   exist: str = None) -> bool:
+        if exist == self.SET_IF_NOT_EXIST and key in self.data:
+            return False
+        if not isinstance(value, bytes):
+            value = str(value).encode()
+        self.data[key] = value
+        return True
+
+    async def _delete(self, key: str, *keys: str) -> int:
+        deleted = 0
+        for k in (key, *keys):
+            deleted += self.data.pop(k, None) is not None
+        return deleted
+
+
+class FakeElastic:
+    def __init__(self, indexes: dict[str, dict[str, dict]],
+                 latency: float = 0.0):
+        self.indexes = indexes
+        self.latency = latency
+
+    async def wait(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get(self, index: str, id: str) -> dict:
+        await self.wait()
+        try:
+            doc = self.indexes[index][id]
+        except KeyError:
+            raise NotFoundError(404, 'not_found', {'_id': id})
+        return {'_index': index, '_id': id, 'found': True, '_source': doc}
+
+    async def mget(self, body: dict, index: str, **kwargs) -> dict:
+        await self.wait()
+        docs = []
+        for id in body['ids']:
+            doc = self.indexes[index].get(id)
+            docs.append({'_index': index, '_id': id, 'found': doc is not None}
+                        | ({'_source': doc} if doc is not None else {}))
+        return {'docs': docs}
+
+    async def search(self, index: str, body: dict, **kwargs) -> dict:
+        """Return documents ordered by the first sort field.
+
+        Only the fields listed in `_source` are returned. Queries are not
+        evaluated: the fake is meant to measure the API, not to reproduce
+        relevance.
+        """
+        await self.wait()
+        docs = list(self.indexes[index].values())
+        fields = list(_sort_fields(body.get('sort', [])))
+        for field, order in reversed(fields):
+            docs.sort(key=lambda d: (d.get(field) is not None, d.get(field)),
+                      reverse=order == 'desc')
+        hits = [{'_index': index, '_id': d['id'], '_source': d}
+                | ({'sort': [d.get(f) for f, _ in fields]} if fields else {})
+                for d in docs]
+        start = body.get('from', 0)
+        if 'search_after' in body:
+            start = next((i + 1 for i, hit in enumerate(hits)
+                          if hit['sort'] == body['search_after']), len(hits))
+        size = body.get('size', 10)
+        page = hits[start:start + size]
+        if '_source' in body:
+            page = [hit | {'_source': {
+                field: hit['_source'][field] for field in body['_source']
+                if field in hit['_source']}} for hit in page]
+        return {
+            'took': 1,
+            'hits': {
+                'total': {'value': len(docs), 'relation': 'eq'},
+                'hits': page,
+            },
+        }
+
+    async def close(self) -> None:
+        pass
+
+
+def _sort_fields(sort):
+    if isinstance(sort, dict):
+        sort = [sort]
+    for item in sort:
+        if isinstance(item, str):
+            item = {item: 'desc' if item == '_score' else 'asc'}
+        for field, order in item.items():
+            if isinstance(order, dict):
+                order = order.get('order', 'asc')
+            yield field, order
+
+
+def make_catalog(films: int = 1000, persons: int = 300, genres: int = 20,
+                 seed: int = 42) -> dict[str, dict[str, dict]]:
+    """Generate documents shaped like the ones the ETL writes."""
+    rnd = random.Random(seed)
+
+    def new_id() -> str:
+        return str(uuid.UUID(int=rnd.getrandbits(128)))
+
+    genre_docs = {}
+    for i in range(genres):
+        id = new_id()
+        genre_docs[id] = {'id': id, 'name': f'Genre {i}',
+                          'description': f'Description of genre {i}'}
+    person_docs = {}
+    for i in range(persons):
+        id = new_id()
+        person_docs[id] = {'id': id, 'full_name': f'Person {i}',
+                           'birth_date': None, 'role': 'actor',
+                           'film_ids': []}
+    film_docs = {}
+    genre_list = list(genre_docs.values())
+    person_list = list(person_docs.values())
+    for i in range(films):
+        id = new_id()
+        cast = rnd.sample(person_list, 5)
+        for person in cast:
+            person['film_ids'].append(id)
+        film_docs[id] = {
+            'id': id,
+            'imdb_rating': round(rnd.uniform(1, 10), 1),
+            'genre': [{'id': g['id'], 'name': g['name']}
+                      for g in rnd.sample(genre_list, 2)],
+            'title': f'Film {i}',
+            'description': ' '.join(rnd.choice(('dog', 'star', 'war', 'love'))
+                                    for _ in range(30)),
+            'director': [{'id': cast[0]['id'], 'name': cast[0]['full_name']}],
+            'actors_names': [p['full_name'] for p in cast[1:4]],
+            'writers_names': [cast[4]['full_name']],
+            'actors': [{'id': p['id'], 'name': p['full_name']}
+                       for p in cast[1:4]],
+            'writers': [{'id': cast[4]['id'], 'name': cast[4]['full_name']}],
+        }
+    return {'movies': film_docs, 'person': person_docs, 'genre': genre_docs}
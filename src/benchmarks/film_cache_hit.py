@@ -0,0 +1,58 @@
+"""Requests per second of the film endpoints when every request is a hit.
+
+Redis and Elasticsearch are replaced with in-process fakes, so the numbers
+show the cost of the API itself: cache lookup, model work and
+serialization. Run it from `src/` on two revisions to compare them:
+
+    python -m benchmarks.film_cache_hit
+    git checkout <other revision> && python -m benchmarks.film_cache_hit
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeElastic, FakeRedis, make_catalog
+from db.elastic import get_elastic
+from db.redis import get_redis
+from main import app
+
+
+async def measure(client: httpx.AsyncClient, url: str, requests: int,
+                  concurrency: int) -> float:
+    response = await client.get(url)
+    response.raise_for_status()
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await client.get(url)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - started)
+
+
+async def main(requests: int, concurrency: int) -> None:
+    catalog = make_catalog()
+    redis = FakeRedis()
+    elastic = FakeElastic(catalog)
+    app.dependency_overrides[get_redis] = lambda: redis
+    app.dependency_overrides[get_elastic] = lambda: elastic
+    film_id = next(iter(catalog['movies']))
+    urls = (f'/api/v1/film/{film_id}', '/api/v1/film/')
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        for url in urls:
+            rps = await measure(client, url, requests, concurrency)
+            print(f'{url:<60} {rps:>10.0f} req/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,283 @@
+"""Mixed load test of every API route with per-endpoint latency percentiles.
+
+Requests follow a Zipf distribution over documents, so a few films and
+persons are hot and the long tail mostly misses the cache, as in real
+traffic. Every concurrency level starts from an empty cache, sends
+--warmup requests and then runs the same seeded request sequence.
+
+Redis and Elasticsearch are in-process fakes by default, with the given
+latency. To measure against real stores, start them with docker-compose,
+let the ETL load dump.sql into ES and pass `--backend local`; the
+workload then uses the documents found in ES.
+Run it from `src/`:
+
+    python -m benchmarks.load_test --save-baseline baseline.json
+    python -m benchmarks.load_test --baseline baseline.json
+
+With a baseline, an endpoint whose RPS drops or whose p95 grows by more
+than --tolerance is reported as a regression and the exit code is 1.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Callable, Optional
+from urllib.parse import quote
+
+import aioredis
+import httpx
+from elasticsearch import AsyncElasticsearch
+
+from benchmarks.fakes import FakeElastic, FakeRedis, make_catalog
+from core import config
+from db.elastic import get_elastic
+from db.redis import get_redis
+from main import app
+from services.base import local_cache
+
+# Share of each route in the workload and how to build its URL from
+# a picker of Zipf-distributed documents
+Picker = Callable[[str], dict]
+ROUTES: dict[str, tuple[float, Callable[[Picker, random.Random], str]]] = {
+    '/api/v1/film/{film_id}': (
+        25, lambda pick, rnd: f'/api/v1/film/{pick("movies")["id"]}'),
+    '/api/v1/film/': (
+        15, lambda pick, rnd: '/api/v1/film/?sort=-imdb_rating'
+                              f'&page_number={zipf_rank(rnd, 10)}'),
+    '/api/v1/film/?filter_genre': (
+        5, lambda pick, rnd: '/api/v1/film/?sort=-imdb_rating'
+                             f'&filter_genre={pick("genre")["id"]}'),
+    '/api/v1/film/search/{film_search_string}': (
+        10, lambda pick, rnd:
+        f'/api/v1/film/search/{search_term(pick("movies")["title"])}'),
+    '/api/v1/film/bulk': (
+        5, lambda pick, rnd: '/api/v1/film/bulk?' + '&'.join(
+            f'ids={pick("movies")["id"]}' for _ in range(5))),
+    '/api/v1/film/{film_id}/alike': (
+        10, lambda pick, rnd: f'/api/v1/film/{pick("movies")["id"]}/alike'),
+    '/api/v1/film/genre/{genre_id}': (
+        5, lambda pick, rnd: f'/api/v1/film/genre/{pick("genre")["id"]}'),
+    '/api/v1/person/{person_id}': (
+        8, lambda pick, rnd: f'/api/v1/person/{pick("person")["id"]}'),
+    '/api/v1/person/': (
+        3, lambda pick, rnd:
+        f'/api/v1/person/?page_number={zipf_rank(rnd, 10)}'),
+    '/api/v1/person/search/{person_search_string}': (
+        5, lambda pick, rnd: '/api/v1/person/search/'
+                             + search_term(pick('person')['full_name'])),
+    '/api/v1/person/bulk': (
+        2, lambda pick, rnd: '/api/v1/person/bulk?' + '&'.join(
+            f'ids={pick("person")["id"]}' for _ in range(5))),
+    '/api/v1/genre/{genre_id}': (
+        5, lambda pick, rnd: f'/api/v1/genre/{pick("genre")["id"]}'),
+    '/api/v1/genre/': (2, lambda pick, rnd: '/api/v1/genre/'),
+}
+
+
+def search_term(text: str) -> str:
+    """The last word of a title or a name, ready for the URL path."""
+    return quote(text.split()[-1], safe='')
+
+
+def zipf_rank(rnd: random.Random, size: int, s: float = 1.1) -> int:
+    """A rank from 0 to size - 1, rank k drawn with weight 1 / (k + 1)^s."""
+    return rnd.choices(range(size), cum_weights=zipf_weights(size, s))[0]
+
+
+_weights: dict[tuple[int, float], list[float]] = {}
+
+
+def zipf_weights(size: int, s: float) -> list[float]:
+    if (size, s) not in _weights:
+        _weights[size, s] = list(itertools.accumulate(
+            1 / (rank + 1) ** s for rank in range(size)))
+    return _weights[size, s]
+
+
+def build_workload(catalog: dict[str, dict[str, dict]], requests: int,
+                   s: float, seed: int) -> list[tuple[str, str]]:
+    """A reproducible sequence of (route, url) pairs."""
+    rnd = random.Random(seed)
+    docs = {index: list(items.values()) for index, items in catalog.items()}
+    for index_docs in docs.values():
+        # The hot documents are a random sample, not the first ones
+        rnd.shuffle(index_docs)
+
+    def pick(index: str) -> dict:
+        return docs[index][rnd.choices(
+            range(len(docs[index])),
+            cum_weights=zipf_weights(len(docs[index]), s))[0]]
+
+    routes = list(ROUTES)
+    weights = [ROUTES[route][0] for route in routes]
+    return [(route, ROUTES[route][1](pick, rnd))
+            for route in rnd.choices(routes, weights=weights, k=requests)]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, round(p / 100 * len(values)) - 1)]
+
+
+async def run_level(client: httpx.AsyncClient,
+                    workload: list[tuple[str, str]], concurrency: int
+                    ) -> dict[str, dict]:
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    requests = iter(workload)
+
+    async def worker() -> None:
+        for route, url in requests:
+            started = time.perf_counter()
+            response = await client.get(url)
+            latencies[route].append(time.perf_counter() - started)
+            if response.status_code >= 500:
+                errors[route] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    report = {}
+    for route in ROUTES:
+        values = sorted(latencies[route])
+        if not values:
+            continue
+        report[route] = {
+            'requests': len(values),
+            'errors': errors[route],
+            'rps': len(values) / elapsed,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+    report['total'] = {'requests': len(workload),
+                       'rps': len(workload) / elapsed}
+    return report
+
+
+async def fake_backend(args) -> tuple[dict, Callable[[], None]]:
+    catalog = make_catalog(films=args.films, persons=args.persons,
+                           seed=args.seed)
+    elastic = FakeElastic(catalog, latency=args.es_latency)
+
+    def reset() -> None:
+        redis = FakeRedis(latency=args.redis_latency)
+        app.dependency_overrides[get_redis] = lambda: redis
+        app.dependency_overrides[get_elastic] = lambda: elastic
+        local_cache.clear()
+    return catalog, reset
+
+
+async def local_backend(args) -> tuple[dict, Callable[[], None]]:
+    """Real Redis and Elasticsearch from core.config.
+
+    Redis is not flushed between levels, only the in-process cache is, so
+    use a dedicated Redis database for benchmarking.
+    """
+    redis = await aioredis.create_redis_pool(
+        (config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20)
+    elastic = AsyncElasticsearch(
+        hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'])
+    catalog = {}
+    for index in ('movies', 'person', 'genre'):
+        docs = await elastic.search(index=index, body={'size': 10000})
+        catalog[index] = {hit['_id']: hit['_source']
+                          for hit in docs['hits']['hits']}
+
+    def reset() -> None:
+        app.dependency_overrides[get_redis] = lambda: redis
+        app.dependency_overrides[get_elastic] = lambda: elastic
+        local_cache.clear()
+    return catalog, reset
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for level, routes in results.items():
+        for route, now in routes.items():
+            before = baseline.get(level, {}).get(route)
+            if not before or route == 'total':
+                continue
+            if now['rps'] < before['rps'] * (1 - tolerance):
+                regressions.append(
+                    f'c={level} {route}: rps {before["rps"]:.0f} -> '
+                    f'{now["rps"]:.0f}')
+            if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'c={level} {route}: p95 {before["p95_ms"]:.2f} -> '
+                    f'{now["p95_ms"]:.2f} ms')
+    return regressions
+
+
+def print_level(concurrency: int, report: dict,
+                baseline: Optional[dict]) -> None:
+    print(f'\nconcurrency {concurrency}: {report["total"]["rps"]:.0f} req/s')
+    print(f'{"endpoint":<46} {"n":>6} {"rps":>8} {"p50 ms":>8} '
+          f'{"p95 ms":>8} {"p99 ms":>8}')
+    for route, row in report.items():
+        if route == 'total':
+            continue
+        line = (f'{route:<46} {row["requests"]:>6} {row["rps"]:>8.0f} '
+                f'{row["p50_ms"]:>8.2f} {row["p95_ms"]:>8.2f} '
+                f'{row["p99_ms"]:>8.2f}')
+        before = (baseline or {}).get(str(concurrency), {}).get(route)
+        if before:
+            line += f'  (p95 {before["p95_ms"]:.2f})'
+        if row['errors']:
+            line += f'  {row["errors"]} errors'
+        print(line)
+
+
+async def main(args) -> int:
+    backend = local_backend if args.backend == 'local' else fake_backend
+    catalog, reset = await backend(args)
+    workload = build_workload(catalog, args.requests, args.zipf, args.seed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = {}
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        for concurrency in args.concurrency:
+            reset()
+            await run_level(client, workload[:args.warmup], concurrency)
+            report = await run_level(client, workload, concurrency)
+            results[str(concurrency)] = report
+            print_level(concurrency, report, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=('fake', 'local'),
+                        default='fake')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--warmup', type=int, default=0,
+                        help='requests sent before measuring each level')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 10, 50])
+    parser.add_argument('--zipf', type=float, default=1.1,
+                        help='Zipf exponent of document popularity')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--films', type=int, default=1000)
+    parser.add_argument('--persons', type=int, default=300)
+    parser.add_argument('--es-latency', type=float, default=0.002,
+                        help='seconds added to every fake ES call')
+    parser.add_argument('--redis-latency', type=float, default=0.0002,
+                        help='seconds added to every fake Redis call')
+    parser.add_argument('--baseline', help='JSON to compare against')
+    parser.add_argument('--save-baseline', help='write results to JSON')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from services.cache import LRUCache
+
+
+class EncodedBody:
+    """ETag of a response body and its gzip version, made once per body."""
+    __slots__ = ('etag', 'gzip')
+
+    def __init__(self, body: bytes):
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.gzip: Optional[bytes] = None
+
+
+def accepts_gzip(headers: Headers) -> bool:
+    """An explicit gzip entry wins over `*`, whatever their order."""
+    qualities = {}
+    for coding in headers.get('accept-encoding', '').split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+        if name not in ('gzip', '*'):
+            continue
+        params = params.replace(' ', '')
+        try:
+            quality = (float(params[2:]) if params.startswith('q=')
+                       else 1.0)
+        except ValueError:
+            quality = 0.0
+        qualities.setdefault(name, quality)
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag
+               for tag in if_none_match.split(','))
+
+
+class CompressionMiddleware:
+    """Gzip and conditional GET for JSON responses.
+
+    The cache is keyed by the body itself. Services return the same bytes
+    object for a cached payload, and bytes keep their hash, so a repeated
+    response costs a dict lookup: the ETag is computed and the body is
+    compressed once per payload, not once per request. A request whose
+    If-None-Match matches gets 304 with no body.
+
+    The gzip representation has its own strong ETag, as it is a
+    different byte sequence.
+    """
+
+    def __init__(self, app, cache_size: int, minimum_size: int = 500,
+                 level: int = 6):
+        self.app = app
+        # Entries never go stale: a changed payload is a different key
+        self.cache = LRUCache(cache_size, ttl=float('inf'))
+        self.minimum_size = minimum_size
+        self.level = level
+
+    def encoded(self, body: bytes) -> EncodedBody:
+        entry = self.cache.get(body)
+        if entry is None:
+            entry = EncodedBody(body)
+            self.cache.set(body, entry)
+        return entry
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return await self.app(scope, receive, send)
+        request_headers = Headers(scope=scope)
+        use_gzip = accepts_gzip(request_headers)
+        if_none_match = request_headers.get('if-none-match')
+        start = None
+
+        async def send_encoded(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if start is None:
+                return await send(message)
+            headers = MutableHeaders(raw=start['headers'])
+            if (start['status'] != 200 or message.get('more_body')
+                    or not headers.get('content-type', '').startswith(
+                        'application/json')
+                    or 'content-encoding' in headers):
+                await send(start)
+                start = None
+                return await send(message)
+            await self.send_body(send, start, headers, message['body'],
+                                 use_gzip, if_none_match)
+
+        await self.app(scope, receive, send_encoded)
+
+    async def send_body(self, send, start: dict, headers: MutableHeaders,
+                        body: bytes, use_gzip: bool,
+                        if_none_match: Optional[str]) -> None:
+        entry = self.encoded(body)
+        use_gzip = use_gzip and len(body) >= self.minimum_size
+        etag = f'"{entry.etag}-gzip"' if use_gzip else f'"{entry.etag}"'
+        headers['etag'] = etag
+        headers.add_vary_header('Accept-Encoding')
+        if if_none_match and etag_matches(if_none_match, etag):
+            del headers['content-length']
+            del headers['content-type']
+            await send(start | {'status': 304})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        if use_gzip:
+            if entry.gzip is None:
+                entry.gzip = gzip.compress(body, self.level, mtime=0)
+            body = entry.gzip
+            headers['content-encoding'] = 'gzip'
+            headers['content-length'] = str(len(body))
+        await send(start)
+        await send({'type': 'http.response.body', 'body': body})
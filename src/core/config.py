@@ -22,3 +22,30 @@ POSTGRES_HOST = os.getenv('POSTGRES_HOST')
 POSTGRES_PORT = os.getenv('POSTGRES_PORT')
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# In-process cache that sits in front of Redis in every worker
+LOCAL_CACHE_SIZE = int(os.getenv('LOCAL_CACHE_SIZE', 1024))
+LOCAL_CACHE_TTL = int(os.getenv('LOCAL_CACHE_TTL', 10))
+
+# Share a single Elasticsearch call between concurrent cache misses
+# of different workers via a Redis lock
+CACHE_LOCK_ENABLED = os.getenv('CACHE_LOCK_ENABLED', 'False') == 'True'
+CACHE_LOCK_TIMEOUT = float(os.getenv('CACHE_LOCK_TIMEOUT', 2))
+CACHE_LOCK_POLL_INTERVAL = float(os.getenv('CACHE_LOCK_POLL_INTERVAL', 0.05))
+
+# How long an expired Redis entry is still served while it is refreshed
+# in the background (stale-while-revalidate)
+CACHE_STALE_TTL = int(os.getenv('CACHE_STALE_TTL', 60 * 10))
+
+# Redis channel the ETL publishes changed document ids to
+CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL',
+                                       'cache_invalidation')
+
+# Upper bound for the number of ids in one bulk request
+BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', 100))
+
+# ETags and gzip bodies of recent responses, kept per worker. Bodies
+# shorter than GZIP_MIN_SIZE bytes are sent as is
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1024))
+GZIP_MIN_SIZE = int(os.getenv('GZIP_MIN_SIZE', 500))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
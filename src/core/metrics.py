@@ -0,0 +1,172 @@
+import bisect
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# Seconds. Cache hits take microseconds, so the scale starts well below
+# the usual Prometheus defaults
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts of observations per bucket plus their sum and count."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+def format_labels(**labels: str) -> str:
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+class Metrics:
+    """Request and per-stage latency of a worker process.
+
+    Stages are the steps of a service call: cache_get, es_query, es_took
+    (the time Elasticsearch reports for a search), deserialize and
+    cache_set. Every worker keeps its own numbers, Prometheus sums them.
+    """
+
+    def __init__(self):
+        self.requests: defaultdict[tuple, Histogram] = defaultdict(Histogram)
+        self.responses = Counter()
+        self.stages: defaultdict[tuple, Histogram] = defaultdict(Histogram)
+
+    def observe_request(self, method: str, endpoint: str, status: int,
+                        seconds: float) -> None:
+        self.requests[method, endpoint].observe(seconds)
+        self.responses[method, endpoint, status] += 1
+
+    def observe(self, es_index: str, stage: str, seconds: float) -> None:
+        self.stages[es_index, stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, es_index: str, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(es_index, stage, time.perf_counter() - started)
+
+    def render(self) -> str:
+        lines = [
+            '# HELP api_request_duration_seconds Time to send a response.',
+            '# TYPE api_request_duration_seconds histogram',
+        ]
+        for (method, endpoint), histogram in sorted(self.requests.items()):
+            lines.extend(histogram.samples(
+                'api_request_duration_seconds',
+                format_labels(method=method, endpoint=endpoint)))
+        lines += [
+            '# HELP api_responses_total Responses by status code.',
+            '# TYPE api_responses_total counter',
+        ]
+        for (method, endpoint, status), count in sorted(
+                self.responses.items()):
+            labels = format_labels(method=method, endpoint=endpoint,
+                                   status=str(status))
+            lines.append(f'api_responses_total{{{labels}}} {count}')
+        lines += [
+            '# HELP api_stage_duration_seconds Time spent in a stage of '
+            'a service call.',
+            '# TYPE api_stage_duration_seconds histogram',
+        ]
+        for (es_index, stage), histogram in sorted(self.stages.items()):
+            lines.extend(histogram.samples(
+                'api_stage_duration_seconds',
+                format_labels(index=es_index, stage=stage)))
+        return '\n'.join(lines) + '\n'
+
+
+def render_cache_stats(stats: dict, single_flight: Counter) -> str:
+    """Cache counters and hit ratio per index and tier.
+
+    `stats` is CacheStats.as_dict(): {index: {tier: {hits, misses, stale}}}.
+    """
+    lines = []
+    for name, kind, help_text in (
+            ('hits', 'counter', 'Cache hits.'),
+            ('misses', 'counter', 'Cache misses.'),
+            ('stale', 'counter', 'Stale entries served while refreshed.'),
+            ('hit_ratio', 'gauge', 'Share of lookups served by the tier.')):
+        metric = f'api_cache_{name}' + ('_total' if kind == 'counter' else '')
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+        for es_index, tiers in sorted(stats.items()):
+            for tier, counts in sorted(tiers.items()):
+                labels = format_labels(index=es_index, tier=tier)
+                if name == 'hit_ratio':
+                    total = counts['hits'] + counts['misses']
+                    value = counts['hits'] / total if total else 0
+                else:
+                    value = counts[name]
+                lines.append(f'{metric}{{{labels}}} {value}')
+    lines += ['# HELP api_single_flight_total Loads started and coalesced.',
+              '# TYPE api_single_flight_total counter']
+    for result, count in sorted(single_flight.items()):
+        lines.append(
+            f'api_single_flight_total{{{format_labels(result=result)}}} '
+            f'{count}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """ASGI middleware that times every request by its route template.
+
+    A plain ASGI middleware keeps the response streaming path untouched,
+    unlike one built on BaseHTTPMiddleware.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+        self.paths: Optional[dict] = None
+
+    def endpoint(self, scope: dict) -> str:
+        """The path template, so that ids do not become separate series."""
+        if self.paths is None:
+            self.paths = {getattr(route, 'endpoint', None): route.path
+                          for route in scope['app'].routes}
+        return self.paths.get(scope.get('endpoint'), 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.observe_request(
+                scope['method'], self.endpoint(scope), status,
+                time.perf_counter() - started)
+
+
+metrics = Metrics()
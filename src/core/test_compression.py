@@ -0,0 +1,132 @@
+import asyncio
+import gzip
+
+import pytest
+from starlette.datastructures import Headers
+
+from core.compression import CompressionMiddleware, accepts_gzip, etag_matches
+
+ETAG = '"0a1b2c"'
+
+
+@pytest.mark.parametrize('if_none_match', [
+    '"0a1b2c"',
+    ' "0a1b2c" ',
+    'W/"0a1b2c"',
+    '"ffff", "0a1b2c"',
+    '"ffff",W/"0a1b2c"',
+    '*',
+    ' * ',
+])
+def test_etag_matches(if_none_match):
+    assert etag_matches(if_none_match, ETAG)
+
+
+@pytest.mark.parametrize('if_none_match', [
+    '',
+    '0a1b2c',
+    '"0a1b2c-gzip"',
+    '"ffff"',
+    '"ffff", "eeee"',
+    '"*"',
+])
+def test_etag_does_not_match(if_none_match):
+    assert not etag_matches(if_none_match, ETAG)
+
+
+@pytest.mark.parametrize('accept_encoding', [
+    'gzip',
+    'GZIP',
+    'deflate, gzip',
+    'gzip;q=0.5',
+    'gzip; q=1',
+    'br;q=1.0, gzip;q=0.8, *;q=0.1',
+    '*',
+    'gzip;level=9',
+    '*;q=0, gzip',
+    'gzip, *;q=0',
+    'identity;q=0, gzip;q=0.1',
+])
+def test_accepts_gzip(accept_encoding):
+    assert accepts_gzip(Headers({'accept-encoding': accept_encoding}))
+
+
+@pytest.mark.parametrize('accept_encoding', [
+    '',
+    'identity',
+    'deflate, br',
+    'gzip;q=0',
+    'gzip; q=0.0',
+    'gzip;q=bad',
+    'x-gzip',
+    'gzip;q=0, *',
+    '*, gzip;q=0',
+    '*;q=0',
+])
+def test_does_not_accept_gzip(accept_encoding):
+    assert not accepts_gzip(Headers({'accept-encoding': accept_encoding}))
+
+
+def test_no_accept_encoding_header():
+    assert not accepts_gzip(Headers({}))
+
+
+BODY = b'[' + b'{"id": "1", "title": "Star"},' * 40 + b'{}]'
+
+
+async def json_app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(BODY)).encode())]})
+    await send({'type': 'http.response.body', 'body': BODY})
+
+
+def get(app, **headers) -> tuple[int, Headers, bytes]:
+    scope = {'type': 'http', 'method': 'GET', 'headers': [
+        (name.replace('_', '-').encode(), value.encode())
+        for name, value in headers.items()]}
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, None, send))
+    start, body = sent
+    return (start['status'], Headers(raw=start['headers']),
+            body['body'])
+
+
+def test_middleware_compresses_for_gzip_clients():
+    app = CompressionMiddleware(json_app, cache_size=8)
+    status, headers, body = get(app, accept_encoding='gzip')
+    assert status == 200
+    assert headers['content-encoding'] == 'gzip'
+    assert headers['etag'].endswith('-gzip"')
+    assert int(headers['content-length']) == len(body)
+    assert gzip.decompress(body) == BODY
+
+
+def test_middleware_keeps_small_bodies():
+    app = CompressionMiddleware(json_app, cache_size=8,
+                                minimum_size=len(BODY) + 1)
+    status, headers, body = get(app, accept_encoding='gzip')
+    assert 'content-encoding' not in headers
+    assert body == BODY
+
+
+def test_middleware_answers_304_to_a_matching_etag():
+    app = CompressionMiddleware(json_app, cache_size=8)
+    _, headers, _ = get(app)
+    status, _, body = get(app, if_none_match=headers['etag'])
+    assert status == 304
+    assert body == b''
+
+
+def test_middleware_etag_depends_on_encoding():
+    app = CompressionMiddleware(json_app, cache_size=8)
+    _, plain, _ = get(app)
+    _, gzipped, _ = get(app, accept_encoding='gzip')
+    assert plain['etag'] != gzipped['etag']
+    status, _, _ = get(app, accept_encoding='gzip',
+                       if_none_match=plain['etag'])
+    assert status == 200
@@ -1,12 +1,20 @@
+import asyncio
+
 import aioredis
 import uvicorn
 from elasticsearch import AsyncElasticsearch
 from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
 from api.v1 import film, genre, person
 from core import config
+from core.compression import CompressionMiddleware
+from core.metrics import (PROMETHEUS_CONTENT_TYPE, MetricsMiddleware,
+                          metrics, render_cache_stats)
 from db import elastic, redis
+from services.base import (cache_stats, generations, local_cache,
+                           single_flight)
+from services.invalidation import CacheInvalidator
 
 app = FastAPI(
     title=config.PROJECT_NAME,
@@ -14,6 +22,12 @@ app = FastAPI(
     openapi_url='/api/openapi.json',
     default_response_class=ORJSONResponse,
 )
+app.add_middleware(CompressionMiddleware,
+                   cache_size=config.RESPONSE_CACHE_SIZE,
+                   minimum_size=config.GZIP_MIN_SIZE,
+                   level=config.GZIP_LEVEL)
+# Added last, so it is the outermost one and times compression too
+app.add_middleware(MetricsMiddleware, metrics=metrics)
 
 
 @app.on_event('startup')
@@ -22,14 +36,27 @@ async def startup():
         (config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20)
     elastic.es = AsyncElasticsearch(
         hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'])
+    invalidator = CacheInvalidator(redis.redis, local_cache, generations)
+    app.state.invalidation_listener = asyncio.create_task(
+        invalidator.listen(config.CACHE_INVALIDATION_CHANNEL))
 
 
 @app.on_event('shutdown')
 async def shutdown():
+    app.state.invalidation_listener.cancel()
     await redis.redis.close()
     await elastic.es.close()
 
 
+@app.get('/metrics', include_in_schema=False)
+async def metrics_endpoint() -> Response:
+    """Metrics of this worker in the Prometheus text format."""
+    return Response(
+        metrics.render()
+        + render_cache_stats(cache_stats.as_dict(), single_flight.stats),
+        media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 app.include_router(film.router, prefix='/api/v1/film', tags=['film'])
 app.include_router(genre.router, prefix='/api/v1/genre', tags=['genre'])
 app.include_router(person.router, prefix='/api/v1/person', tags=['person'])
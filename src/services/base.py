@@ -1,113 +1,405 @@
-import json
-from typing import Optional
+import asyncio
+import base64
+import binascii
+import logging
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional, Union, get_type_hints
 
+import orjson
 from aioredis import Redis
-from elasticsearch import AsyncElasticsearch
-from pydantic import BaseModel, parse_raw_as
-from pydantic.json import pydantic_encoder
+from elasticsearch import AsyncElasticsearch, RequestError
+from pydantic import BaseModel, create_model
+
+from core import config
+from core.metrics import metrics
+from services.cache import (Cached, CacheStats, LRUCache, build_key,
+                            by_id_key, index_of, pack, unpack)
+from services.invalidation import Generations
+from services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+local_cache = LRUCache(config.LOCAL_CACHE_SIZE, config.LOCAL_CACHE_TTL)
+cache_stats = CacheStats()
+single_flight = SingleFlight()
+generations = Generations()
+background_tasks: set[asyncio.Task] = set()
+
+Loader = Callable[[], Awaitable[Union[bytes, Cached, None]]]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def encode_cursor(sort_values: list) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(sort_values)).decode()
+
+
+def decode_cursor(cursor: str, sort: list) -> list:
+    """Sort values of the last hit of the previous page.
+
+    A cursor must hold one plain value for every field of the sort, so
+    that a token built for another listing fails here and not in ES.
+    """
+    try:
+        sort_values = orjson.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(cursor)
+    if (not isinstance(sort_values, list) or len(sort_values) != len(sort)
+            or not all(isinstance(value, (str, int, float))
+                       and not isinstance(value, bool)
+                       for value in sort_values)):
+        raise InvalidCursor(cursor)
+    return sort_values
+
+
+def render(some_obj: dict, shape: BaseModel) -> bytes:
+    """Serialize a document into the response body of the given shape."""
+    return orjson.dumps(shape(**some_obj).dict())
+
+
+def render_list(obj_list: list[dict], shape: BaseModel) -> Optional[bytes]:
+    if not obj_list:
+        return None
+    return orjson.dumps([shape(**some_obj).dict() for some_obj in obj_list])
+
+
+def select_fields(shape: BaseModel,
+                  fields: Optional[str] = None) -> tuple[str, ...]:
+    """Fields of the shape a listing fetches and sends, in shape order.
+
+    `fields` is a comma-separated subset asked for by the client, all
+    fields by default. The id is always kept, so that clients can
+    tell the documents apart and fetch the full ones.
+    """
+    if not fields:
+        return tuple(shape.__fields__)
+    requested = {name.strip() for name in fields.split(',')} - {''}
+    unknown = requested - shape.__fields__.keys()
+    if unknown:
+        raise InvalidFields(', '.join(sorted(unknown)))
+    return tuple(name for name in shape.__fields__
+                 if name in requested or name == 'id')
+
+
+@lru_cache()
+def projection(shape: BaseModel, fields: tuple[str, ...]) -> BaseModel:
+    """The shape reduced to the given fields, validated the same way."""
+    if fields == tuple(shape.__fields__):
+        return shape
+    hints = get_type_hints(shape)
+    return create_model(
+        f'{shape.__name__}Fields',
+        **{name: (hints[name], ... if shape.__fields__[name].required
+                  else shape.__fields__[name].default)
+           for name in fields})
 
 
 class BaseService:
+    """Cached access to Elasticsearch documents.
+
+    Both cache tiers store ready response bodies: a cache hit returns the
+    bytes as they should be sent, without building any model.
+    """
+
     def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
         self.redis = redis
         self.elastic = elastic
+        self.local_cache = local_cache
+        self.cache_stats = cache_stats
+        self.single_flight = single_flight
+        self.generations = generations
+        self.metrics = metrics
 
-    async def _get_by_id(
-            self, id: str, cache_expire: int, model: BaseModel, es_index: str
-    ) -> Optional[BaseModel]:
-        some_obj = await self._get_by_id_from_cache(id, model)
-        if not some_obj:
-            some_obj = await self._get_by_id_from_elastic(id, model, es_index)
-            if not some_obj:
+    async def _get_or_load(self, key: str, expire: int,
+                           from_elastic: Loader) -> Optional[bytes]:
+        entry = await self._get_entry_or_load(key, expire, from_elastic)
+        return entry.payload if entry else None
+
+    async def _get_entry_or_load(self, key: str, expire: int,
+                                 from_elastic: Loader) -> Optional[Cached]:
+        entry, stale = await self._get_from_cache(key)
+        if entry:
+            if stale:
+                self._refresh_in_background(key, expire, from_elastic)
+            return entry
+        return await self.single_flight.do(
+            key, lambda: self._load(key, expire, from_elastic))
+
+    def _refresh_in_background(self, key: str, expire: int,
+                               from_elastic: Loader) -> None:
+        task = asyncio.ensure_future(self.single_flight.do(
+            key, lambda: self._load(key, expire, from_elastic)))
+        background_tasks.add(task)
+        task.add_done_callback(self._background_done)
+
+    @staticmethod
+    def _background_done(task: asyncio.Task) -> None:
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning('Background cache refresh failed',
+                           exc_info=task.exception())
+
+    async def _load(self, key: str, expire: int,
+                    from_elastic: Loader) -> Optional[Cached]:
+        locked = await self._acquire_lock(key)
+        if not locked:
+            entry = await self._wait_for_cache(key)
+            if entry:
+                self.single_flight.stats['lock_coalesced'] += 1
+                return entry
+        try:
+            entry = await from_elastic()
+            if not entry:
                 return None
-            await self._put_by_id_to_cache(some_obj, cache_expire)
-        return some_obj
+            if isinstance(entry, bytes):
+                entry = Cached(entry)
+            await self._put_to_cache(key, entry, expire)
+            return entry
+        finally:
+            if locked:
+                await self.redis.delete(f'lock:{key}')
 
-    async def _get_by_id_from_cache(
-            self, id: str, model: BaseModel) -> Optional[BaseModel]:
-        data = await self.redis.get(id)
-        if not data:
-            return None
-        return model.parse_raw(data)
+    async def _acquire_lock(self, key: str) -> bool:
+        if not config.CACHE_LOCK_ENABLED:
+            return True
+        return bool(await self.redis.set(
+            f'lock:{key}', 1,
+            pexpire=int(config.CACHE_LOCK_TIMEOUT * 1000),
+            exist=Redis.SET_IF_NOT_EXIST))
+
+    async def _wait_for_cache(self, key: str) -> Optional[Cached]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.CACHE_LOCK_TIMEOUT
+        while loop.time() < deadline:
+            await asyncio.sleep(config.CACHE_LOCK_POLL_INTERVAL)
+            entry, _ = await self._get_from_cache(key)
+            if entry:
+                return entry
+        return None
+
+    async def _get_by_id(
+            self, id: str, cache_expire: int, shape: BaseModel, es_index: str
+    ) -> Optional[bytes]:
+        return await self._get_or_load(
+            by_id_key(es_index, id), cache_expire,
+            self._by_id_loader(id, shape, es_index))
+
+    def _by_id_loader(self, id: str, shape: BaseModel,
+                      es_index: str) -> Loader:
+        return lambda: self._get_by_id_from_elastic(id, shape, es_index)
 
     async def _get_by_id_from_elastic(
-            self, id: str, model: BaseModel, es_index: str) -> BaseModel:
-        doc = await self.elastic.get(es_index, id)
-        return model(**doc['_source'])
+            self, id: str, shape: BaseModel, es_index: str) -> bytes:
+        with self.metrics.timer(es_index, 'es_query'):
+            doc = await self.elastic.get(es_index, id)
+        with self.metrics.timer(es_index, 'deserialize'):
+            return render(doc['_source'], shape)
 
-    async def _put_by_id_to_cache(self, model: BaseModel, expire: int):
-        await self.redis.set(model.id, model.json(), expire=expire)
+    async def _get_many_by_id(
+            self, ids: list[str], cache_expire: int, shape: BaseModel,
+            es_index: str) -> list[bytes]:
+        """Fetch several documents with one round trip per backing store.
+
+        Documents that are not found are skipped, the rest keep the order
+        of `ids`.
+        """
+        keys = {id: by_id_key(es_index, id) for id in ids}
+        with self.metrics.timer(es_index, 'cache_get'):
+            found = await self._get_many_from_cache(
+                keys, cache_expire, shape, es_index)
+        missing = [id for id in keys if id not in found]
+        if missing:
+            loaded = await self._get_many_by_id_from_elastic(
+                missing, shape, es_index)
+            await self._put_many_to_cache(
+                {keys[id]: payload for id, payload in loaded.items()},
+                cache_expire)
+            found.update(loaded)
+        return [found[id] for id in keys if id in found]
+
+    async def _get_many_from_cache(
+            self, keys: dict[str, str], cache_expire: int, shape: BaseModel,
+            es_index: str) -> dict[str, bytes]:
+        found = {}
+        for id, key in keys.items():
+            entry = self.local_cache.get(key)
+            if entry:
+                self.cache_stats.hit('memory', es_index)
+                found[id] = entry.payload
+            else:
+                self.cache_stats.miss('memory', es_index)
+        missing = [id for id in keys if id not in found]
+        if missing:
+            raw_list = await self.redis.mget(*(keys[id] for id in missing))
+            for id, raw in zip(missing, raw_list):
+                if not raw:
+                    self.cache_stats.miss('redis', es_index)
+                    continue
+                self.cache_stats.hit('redis', es_index)
+                entry, stale = unpack(raw)
+                if stale:
+                    self.cache_stats.stale_hit('redis', es_index)
+                    self._refresh_in_background(
+                        keys[id], cache_expire,
+                        self._by_id_loader(id, shape, es_index))
+                self.local_cache.set(keys[id], entry)
+                found[id] = entry.payload
+        return found
+
+    async def _get_many_by_id_from_elastic(
+            self, ids: list[str], shape: BaseModel,
+            es_index: str) -> dict[str, bytes]:
+        with self.metrics.timer(es_index, 'es_query'):
+            docs = await self.elastic.mget(body={'ids': ids}, index=es_index)
+        with self.metrics.timer(es_index, 'deserialize'):
+            return {doc['_id']: render(doc['_source'], shape)
+                    for doc in docs['docs'] if doc.get('found')}
+
+    async def _put_many_to_cache(
+            self, payloads: dict[str, bytes], expire: int) -> None:
+        if not payloads:
+            return
+        with self.metrics.timer(index_of(next(iter(payloads))), 'cache_set'):
+            pipe = self.redis.pipeline()
+            for key, payload in payloads.items():
+                pipe.set(key, pack(payload, expire),
+                         expire=expire + config.CACHE_STALE_TTL)
+            await pipe.execute()
+            for key, payload in payloads.items():
+                self.local_cache.set(key, Cached(payload), ttl=expire)
 
     async def _get_by_search(self, search_string: str, search_field: str,
-                             expire: int, es_index: str, model: BaseModel
-                             ) -> Optional[list[BaseModel]]:
-        obj_list = await self._get_from_cache(
-            key=f'{es_index}:{search_string}', model=model)
-        if not obj_list:
-            obj_list = await self._get_by_search_from_elastic(
-                search_string, search_field, es_index, model)
-            if not obj_list:
-                return None
-            await self._put_to_cache(key=f'{es_index}:{search_string}',
-                                     model_list=obj_list, expire=expire)
-        return obj_list
+                             expire: int, es_index: str, shape: BaseModel,
+                             fields: Optional[str] = None
+                             ) -> Optional[bytes]:
+        selected = select_fields(shape, fields)
+        key = build_key(es_index, 'search', shape=shape.__name__,
+                        search_string=search_string,
+                        search_field=search_field, fields=selected,
+                        generation=await self._generation(es_index))
+        return await self._get_or_load(
+            key, expire,
+            lambda: self._get_by_search_from_elastic(
+                search_string, search_field, es_index, shape, selected))
 
     async def _get_by_search_from_elastic(
             self, search_string: str, search_field: str,
-            es_index: str, model: BaseModel) -> list[BaseModel]:
-        doc = await self.elastic.search(
-            index=es_index,
-            body={"query": {
+            es_index: str, shape: BaseModel,
+            fields: Optional[tuple[str, ...]] = None) -> Optional[bytes]:
+        fields = fields or select_fields(shape)
+        doc = await self._search(
+            es_index,
+            {"query": {
                 "match": {
                     search_field: {
                         "query": search_string,
                         "fuzziness": "auto"
                     }
                 }
-            }})
-        return [model(**d['_source']) for d in doc['hits']['hits']]
+            }, "_source": list(fields)})
+        with self.metrics.timer(es_index, 'deserialize'):
+            return render_list([d['_source'] for d in doc['hits']['hits']],
+                               projection(shape, fields))
+
+    async def _search(self, es_index: str, body: dict) -> dict:
+        """Search the index, recording the round trip and the time ES took."""
+        with self.metrics.timer(es_index, 'es_query'):
+            docs = await self.elastic.search(index=es_index, body=body)
+        self.metrics.observe(es_index, 'es_took', docs['took'] / 1000)
+        return docs
 
     async def _get_list(
             self, page_number: int, page_size: int,
-            expire: int, es_index: str, model: BaseModel
-    ) -> Optional[list[BaseModel]]:
-        obj_list = await self._get_from_cache(
-            key=f'{es_index}:{page_number}:{page_size}', model=model
-        )
-        if not obj_list:
-            obj_list = await self._get_list_from_elastic(page_number,
-                                                         page_size,
-                                                         es_index,
-                                                         model)
-            if not obj_list:
-                return None
-            await self._put_to_cache(
-                key=f'{es_index}:{page_number}:{page_size}',
-                model_list=obj_list, expire=expire)
-        return obj_list
+            expire: int, es_index: str, shape: BaseModel,
+            cursor: Optional[str] = None, fields: Optional[str] = None,
+            sort: Optional[list] = None) -> Optional[Cached]:
+        """A page of the index in ES order, unless `sort` is given.
+
+        Only a sorted listing gets cursors, see _get_list_from_elastic.
+        """
+        selected = select_fields(shape, fields)
+        key = build_key(es_index, 'list', shape=shape.__name__,
+                        page_number=page_number, page_size=page_size,
+                        cursor=cursor, fields=selected,
+                        generation=await self._generation(es_index))
+        return await self._get_entry_or_load(
+            key, expire,
+            lambda: self._get_list_from_elastic(
+                page_number, page_size, es_index, shape,
+                query={"sort": sort} if sort else None, cursor=cursor,
+                fields=selected))
 
     async def _get_list_from_elastic(
             self, page_number: int, page_size: int, es_index: str,
-            model: BaseModel, query: dict = None) -> list[BaseModel]:
-        body = {"from": page_number * page_size, "size": page_size}
-        if query:
-            body = body | query
-        docs = await self.elastic.search(
-            index=es_index,
-            body=body
-        )
-        return [model(**d['_source']) for d in docs['hits']['hits']]
-
-    async def _put_to_cache(self, model_list: list[BaseModel],
-                            expire: int, key: str):
-        list_json = json.dumps(model_list, default=pydantic_encoder)
-        await self.redis.set(key, list_json, expire=expire)
+            shape: BaseModel, query: dict = None,
+            cursor: Optional[str] = None,
+            fields: Optional[tuple[str, ...]] = None) -> Optional[Cached]:
+        """Fetch a page by its number or by the cursor of the previous one.
 
-    async def _get_from_cache(
-            self, key: str, model: BaseModel) -> Optional[list[BaseModel]]:
-        data = await self.redis.get(key)
-        if not data:
+        A cursor pages with search_after, so every page costs the same as
+        the first one. It needs a sort ending with a unique field.
+        Elasticsearch sends only the fields of the shape, or the `fields`
+        subset of them.
+        """
+        fields = fields or select_fields(shape)
+        query = query or {}
+        if cursor:
+            body = {"size": page_size, "search_after": decode_cursor(
+                cursor, query.get("sort", []))}
+        else:
+            body = {"from": page_number * page_size, "size": page_size}
+        body["_source"] = list(fields)
+        try:
+            docs = await self._search(es_index, body | query)
+        except RequestError:
+            # A value of the wrong type for its sort field
+            if cursor:
+                raise InvalidCursor(cursor)
+            raise
+        hits = docs['hits']['hits']
+        with self.metrics.timer(es_index, 'deserialize'):
+            payload = render_list([d['_source'] for d in hits],
+                                  projection(shape, fields))
+        if not payload:
             return None
-        return parse_raw_as(list[model], data)
+        next_cursor = None
+        if len(hits) == page_size and 'sort' in hits[-1]:
+            next_cursor = encode_cursor(hits[-1]['sort'])
+        return Cached(payload, next_cursor)
 
+    async def _put_to_cache(self, key: str, entry: Cached, expire: int):
+        with self.metrics.timer(index_of(key), 'cache_set'):
+            await self.redis.set(
+                key, pack(entry.payload, expire, entry.cursor),
+                expire=expire + config.CACHE_STALE_TTL)
+            self.local_cache.set(key, entry, ttl=expire)
 
+    async def _generation(self, es_index: str) -> int:
+        """Generation of the index, a part of its list and search keys."""
+        return await self.generations.get(self.redis, es_index)
+
+    async def _get_from_cache(
+            self, key: str) -> tuple[Optional[Cached], bool]:
+        es_index = index_of(key)
+        with self.metrics.timer(es_index, 'cache_get'):
+            entry = self.local_cache.get(key)
+            if entry:
+                self.cache_stats.hit('memory', es_index)
+                return entry, False
+            self.cache_stats.miss('memory', es_index)
+            raw = await self.redis.get(key)
+            if not raw:
+                self.cache_stats.miss('redis', es_index)
+                return None, False
+            self.cache_stats.hit('redis', es_index)
+            entry, stale = unpack(raw)
+            if stale:
+                self.cache_stats.stale_hit('redis', es_index)
+            self.local_cache.set(key, entry)
+            return entry, stale
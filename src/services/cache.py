@@ -0,0 +1,129 @@
+import hashlib
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional, Union
+
+import orjson
+
+
+class CacheStats:
+    """Hit and miss counters per index and cache tier ('memory', 'redis')."""
+
+    def __init__(self):
+        self.hits = Counter()
+        self.misses = Counter()
+        self.stale = Counter()
+
+    def hit(self, tier: str, es_index: str) -> None:
+        self.hits[es_index, tier] += 1
+
+    def miss(self, tier: str, es_index: str) -> None:
+        self.misses[es_index, tier] += 1
+
+    def stale_hit(self, tier: str, es_index: str) -> None:
+        self.stale[es_index, tier] += 1
+
+    def as_dict(self) -> dict:
+        stats = {}
+        for es_index, tier in set(self.hits) | set(self.misses):
+            key = es_index, tier
+            stats.setdefault(es_index, {})[tier] = {
+                'hits': self.hits[key], 'misses': self.misses[key],
+                'stale': self.stale[key]}
+        return stats
+
+
+def build_key(es_index: str, method: str, **params: Any) -> str:
+    """Build the cache key of a service call from all of its parameters.
+
+    Parameters are hashed in a canonical form, so the same call always maps
+    to the same key and calls that differ in any parameter never share one.
+    """
+    digest = hashlib.sha1(
+        orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return f'{es_index}:{method}:{digest}'
+
+
+def by_id_key(es_index: str, id: str) -> str:
+    return build_key(es_index, 'by_id', id=id)
+
+
+def index_of(key: str) -> str:
+    """The index a key built by build_key belongs to."""
+    return key.partition(':')[0]
+
+
+class Cached(NamedTuple):
+    """Cached response body and the cursor of the page that follows it."""
+    payload: bytes
+    cursor: Optional[str] = None
+
+
+def pack(data: Union[str, bytes], soft_ttl: int,
+         cursor: Optional[str] = None) -> bytes:
+    """Prefix a cached payload with the moment it becomes stale.
+
+    The cursor of the next page, if any, goes into the same header line.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    header = b'%.3f' % (time.time() + soft_ttl)
+    if cursor:
+        header += b' ' + cursor.encode()
+    return header + b'\n' + data
+
+
+def unpack(raw: bytes) -> tuple[Cached, bool]:
+    """Split a packed payload into the cached entry and its staleness flag.
+
+    Entries written before the soft TTL was introduced have no prefix and
+    are treated as fresh.
+    """
+    if raw[:1] in (b'{', b'['):
+        return Cached(raw), False
+    header, _, data = raw.partition(b'\n')
+    soft_expire_at, _, cursor = header.partition(b' ')
+    return (Cached(data, cursor.decode() or None),
+            float(soft_expire_at) < time.time())
+
+
+class LRUCache:
+    """Bounded in-process cache with per-entry TTL and LRU eviction.
+
+    Values are stored as is and returned without any deserialization.
+    The cache is local to a worker process.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expire_at, value = item
+        if expire_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: int = None) -> None:
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
@@ -1,95 +1,122 @@
 from functools import lru_cache
 from typing import Optional
 
+import orjson
 from aioredis import Redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 
 from db.elastic import get_elastic
 from db.redis import get_redis
-from models.models import Film
-from services.base import BaseService
+from models.models import Film, FilmShort
+from services.base import (BaseService, projection, render_list,
+                           select_fields)
+from services.cache import Cached, build_key
 
-FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 60 * 6
+FILM_ALIKE_SIZE = 20
 
 
 class FilmService(BaseService):
     es_index = 'movies'
     model = Film
+    short_model = FilmShort
 
-    async def get_film_by_id(self, film_id: str) -> Optional[Film]:
+    async def get_film_by_id(self, film_id: str) -> Optional[bytes]:
         return await self._get_by_id(film_id, FILM_CACHE_EXPIRE_IN_SECONDS,
                                      self.model, self.es_index)
 
+    async def get_films_by_ids(self, film_ids: list[str]) -> list[bytes]:
+        return await self._get_many_by_id(
+            film_ids, FILM_CACHE_EXPIRE_IN_SECONDS,
+            self.model, self.es_index)
+
     async def get_film_by_search(
-            self, search_string: str) -> Optional[list[Film]]:
+            self, search_string: str,
+            fields: Optional[str] = None) -> Optional[bytes]:
         return await self._get_by_search(search_string, 'title',
                                          FILM_CACHE_EXPIRE_IN_SECONDS,
-                                         self.es_index, self.model)
+                                         self.es_index, self.short_model,
+                                         fields=fields)
 
     async def get_film_sorted(
             self, sort_field: str, sort_type: str, filter_genre: str,
-            page_number: int, page_size: int) -> Optional[list[Film]]:
-        query = {"sort": {sort_field: sort_type}}
+            page_number: int, page_size: int,
+            cursor: Optional[str] = None,
+            fields: Optional[str] = None) -> Optional[Cached]:
+        selected = select_fields(self.short_model, fields)
+        query = {"sort": [{sort_field: sort_type}, {"id": "asc"}]}
         if filter_genre:
-            query = query | {
-                "query": {"match": {"genre.id": {"query": filter_genre}}}}
-        film_list = await self._get_from_cache(
-            key=f'{sort_field}:{sort_type}:{filter_genre}:{self.es_index}',
-            model=self.model
-        )
-        if not film_list:
-            film_list = await self._get_list_from_elastic(page_number,
-                                                          page_size,
-                                                          self.es_index,
-                                                          self.model,
-                                                          query=query)
-            if not film_list:
-                return None
-            await self._put_to_cache(
-                model_list=film_list,
-                expire=FILM_CACHE_EXPIRE_IN_SECONDS,
-                key=f'{sort_field}:{sort_type}:{filter_genre}:{self.es_index}'
-            )
-        return film_list
+            query = query | {"query": {"bool": {"filter": {"nested": {
+                "path": "genre",
+                "query": {"term": {"genre.id": filter_genre}}
+            }}}}}
+        key = build_key(self.es_index, 'sorted',
+                        shape=self.short_model.__name__,
+                        sort_field=sort_field, sort_type=sort_type,
+                        filter_genre=filter_genre, page_number=page_number,
+                        page_size=page_size, cursor=cursor,
+                        fields=selected,
+                        generation=await self._generation(self.es_index))
+        return await self._get_entry_or_load(
+            key, FILM_CACHE_EXPIRE_IN_SECONDS,
+            lambda: self._get_list_from_elastic(page_number, page_size,
+                                                self.es_index,
+                                                self.short_model,
+                                                query=query, cursor=cursor,
+                                                fields=selected))
 
-    async def get_film_alike(self, film_id: str) -> list[Film]:
-        film_list = await self._get_from_cache(
-            key=f'alike:{film_id}',
-            model=self.model
-        )
-        if not film_list:
-            film_list = await self._get_film_alike_from_elastic(film_id)
-            if not film_list:
-                return None
-            await self._put_to_cache(film_list, FILM_CACHE_EXPIRE_IN_SECONDS,
-                                     f'alike:{film_id}')
-        return film_list
+    async def get_film_alike(
+            self, film_id: str,
+            fields: Optional[str] = None) -> Optional[bytes]:
+        selected = select_fields(self.short_model, fields)
+        key = build_key(self.es_index, 'alike',
+                        shape=self.short_model.__name__, film_id=film_id,
+                        size=FILM_ALIKE_SIZE, fields=selected,
+                        generation=await self._generation(self.es_index))
+        return await self._get_or_load(
+            key, FILM_CACHE_EXPIRE_IN_SECONDS,
+            lambda: self._get_film_alike_from_elastic(film_id, selected))
 
     async def _get_film_alike_from_elastic(
-            self, film_id: str) -> Optional[list[Film]]:
+            self, film_id: str,
+            fields: tuple[str, ...]) -> Optional[bytes]:
         film = await self.get_film_by_id(film_id)
-        if not film or not film.genre:
+        if not film:
+            return None
+        genre = orjson.loads(film)['genre'] or ()
+        genre_ids = [g['id'] for g in genre]
+        if not genre_ids:
             return None
-        result = []
-        for genre in film.genre:
-            alike_films = await self.get_film_sorted(
-                sort_field='imdb_rating',
-                sort_type='desc',
-                filter_genre=genre['id'],
-                page_number=0,
-                page_size=10)
-            if alike_films:
-                result.extend(alike_films)
-        return result
+        docs = await self._search(
+            self.es_index,
+            {
+                "size": FILM_ALIKE_SIZE,
+                "query": {"bool": {
+                    "must": {"nested": {
+                        "path": "genre",
+                        "score_mode": "sum",
+                        "query": {"terms": {"genre.id": genre_ids}}
+                    }},
+                    "must_not": {"ids": {"values": [film_id]}}
+                }},
+                "sort": ["_score", {"imdb_rating": "desc"}, {"id": "asc"}],
+                "_source": list(fields)
+            })
+        with self.metrics.timer(self.es_index, 'deserialize'):
+            return render_list([d['_source'] for d in docs['hits']['hits']],
+                               projection(self.short_model, fields))
 
-    async def get_popular_in_genre(self, genre_id: str, ) -> list[Film]:
+    async def get_popular_in_genre(
+            self, genre_id: str,
+            fields: Optional[str] = None) -> Optional[bytes]:
         film_list = await self.get_film_sorted(sort_field='imdb_rating',
                                                sort_type='desc',
                                                filter_genre=genre_id,
                                                page_number=0,
-                                               page_size=30)
-        return film_list
+                                               page_size=30,
+                                               fields=fields)
+        return film_list.payload if film_list else None
 
 
 @lru_cache()
@@ -10,22 +10,28 @@ from db.redis import get_redis
 from models.models import Genre
 from services.base import BaseService
 
-GENRE_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+GENRE_CACHE_EXPIRE_IN_SECONDS = 60 * 60 * 6
 
 
 class GenreService(BaseService):
     es_index = 'genre'
     model = Genre
 
-    async def get_by_id(self, genre_id: str) -> Optional[Genre]:
+    async def get_by_id(self, genre_id: str) -> Optional[bytes]:
         return await self._get_by_id(genre_id, GENRE_CACHE_EXPIRE_IN_SECONDS,
                                      self.model, self.es_index)
 
+    async def get_by_ids(self, genre_ids: list[str]) -> list[bytes]:
+        return await self._get_many_by_id(
+            genre_ids, GENRE_CACHE_EXPIRE_IN_SECONDS,
+            self.model, self.es_index)
+
     async def get_genre_list(
-            self, page_number: int, page_size: int) -> Optional[list[Genre]]:
-        return await self._get_list(page_number, page_size,
-                                    GENRE_CACHE_EXPIRE_IN_SECONDS,
-                                    self.es_index, self.model)
+            self, page_number: int, page_size: int) -> Optional[bytes]:
+        genre_list = await self._get_list(page_number, page_size,
+                                          GENRE_CACHE_EXPIRE_IN_SECONDS,
+                                          self.es_index, self.model)
+        return genre_list.payload if genre_list else None
 
 
 @lru_cache()
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+import aioredis
+from aioredis import Redis
+
+from core import config
+from services.cache import LRUCache, by_id_key
+
+logger = logging.getLogger(__name__)
+
+
+def generation_key(es_index: str) -> str:
+    return f'generation:{es_index}'
+
+
+class Generations:
+    """Generation of every index, a part of its list and search cache keys.
+
+    The ETL increments the generation in Redis with every change it
+    publishes. Any change to an index, a new document included, then moves
+    its lists, searches and alike films to fresh keys, and the old entries
+    are never read again. A worker keeps the last generation it saw and
+    takes newer ones from the invalidation messages.
+    """
+
+    def __init__(self):
+        self.values: dict[str, int] = {}
+
+    async def get(self, redis: Redis, es_index: str) -> int:
+        if es_index not in self.values:
+            self.update(es_index, int(await redis.get(
+                generation_key(es_index)) or 0))
+        return self.values[es_index]
+
+    def update(self, es_index: str, generation: int) -> None:
+        self.values[es_index] = max(generation,
+                                    self.values.get(es_index, 0))
+
+    def clear(self) -> None:
+        self.values.clear()
+
+
+class CacheInvalidator:
+    """Drop cache entries for documents the ETL reported as changed.
+
+    By-id entries are found by the index and id of the document. Lists,
+    searches and alike films of the index move on to the generation that
+    comes with the message.
+    """
+
+    def __init__(self, redis: Redis, local_cache: LRUCache,
+                 generations: Generations):
+        self.redis = redis
+        self.local_cache = local_cache
+        self.generations = generations
+
+    async def invalidate(self, es_index: str, ids: list[str]) -> None:
+        if not ids:
+            return
+        keys = [by_id_key(es_index, id) for id in ids]
+        for key in keys:
+            self.local_cache.delete(key)
+        await self.redis.delete(*keys)
+
+    async def invalidate_index(self, es_index: str) -> None:
+        """Drop every entry of an index after the ETL rebuilt it."""
+        keys = [key async for key in self.redis.iscan(match=f'{es_index}:*')]
+        if keys:
+            await self.redis.delete(*keys)
+        self.local_cache.clear()
+
+    async def handle(self, message: dict) -> None:
+        if message.get('reindex'):
+            await self.invalidate_index(message['index'])
+        else:
+            await self.invalidate(message['index'], message['ids'])
+        if 'generation' in message:
+            self.generations.update(message['index'], message['generation'])
+        logger.info('Invalidated %d %s documents',
+                    len(message['ids']), message['index'])
+
+    async def listen(self, channel_name: str) -> None:
+        while True:
+            try:
+                conn = await aioredis.create_redis(
+                    (config.REDIS_HOST, config.REDIS_PORT))
+                try:
+                    channel, = await conn.subscribe(channel_name)
+                    # Messages sent while unsubscribed are lost: generations
+                    # are read from Redis again
+                    self.generations.clear()
+                    while await channel.wait_message():
+                        await self.handle(await channel.get_json())
+                finally:
+                    conn.close()
+                    await conn.wait_closed()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Cache invalidation listener failed')
+                await asyncio.sleep(1)
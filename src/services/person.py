@@ -9,29 +9,40 @@ from db.elastic import get_elastic
 from db.redis import get_redis
 from models.models import Person
 from services.base import BaseService
+from services.cache import Cached
 
-PERSON_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+PERSON_CACHE_EXPIRE_IN_SECONDS = 60 * 60 * 6
 
 
 class PersonService(BaseService):
     es_index = 'person'
     model = Person
 
-    async def get_by_id(self, person_id: str) -> Optional[Person]:
+    async def get_by_id(self, person_id: str) -> Optional[bytes]:
         return await self._get_by_id(person_id, PERSON_CACHE_EXPIRE_IN_SECONDS,
                                      self.model, self.es_index)
 
+    async def get_by_ids(self, person_ids: list[str]) -> list[bytes]:
+        return await self._get_many_by_id(
+            person_ids, PERSON_CACHE_EXPIRE_IN_SECONDS,
+            self.model, self.es_index)
+
     async def get_person_list(
-            self, page_number: int, page_size: int) -> Optional[list[Person]]:
+            self, page_number: int, page_size: int,
+            cursor: Optional[str] = None,
+            fields: Optional[str] = None) -> Optional[Cached]:
         return await self._get_list(page_number, page_size,
                                     PERSON_CACHE_EXPIRE_IN_SECONDS,
-                                    self.es_index, self.model)
+                                    self.es_index, self.model, cursor=cursor,
+                                    fields=fields, sort=[{"id": "asc"}])
 
     async def get_by_search(
-            self, search_string: str) -> Optional[list[Person]]:
+            self, search_string: str,
+            fields: Optional[str] = None) -> Optional[bytes]:
         return await self._get_by_search(search_string, 'full_name',
                                          PERSON_CACHE_EXPIRE_IN_SECONDS,
-                                         self.es_index, self.model)
+                                         self.es_index, self.model,
+                                         fields=fields)
 
 
 @lru_cache()
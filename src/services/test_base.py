@@ -0,0 +1,119 @@
+import base64
+
+import pytest
+from pydantic import ValidationError
+
+from models.models import Film, FilmShort
+from services.base import (InvalidCursor, InvalidFields, decode_cursor,
+                           encode_cursor, projection, select_fields)
+
+SORT = [{'imdb_rating': 'desc'}, {'id': 'asc'}]
+
+
+@pytest.mark.parametrize('sort_values', [
+    [8.5, 'b1f2'],
+    [9, 'b1f2'],
+    ['Фильм', 'b1f2'],
+])
+def test_cursor_round_trip(sort_values):
+    cursor = encode_cursor(sort_values)
+    assert decode_cursor(cursor, SORT) == sort_values
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(['??>>', '~~~'])
+    assert not set(cursor) & {'+', '/'}
+
+
+def raw_cursor(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode()
+
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    'not base64!',
+    'YWJj',
+    raw_cursor(b'{"imdb_rating": 8.5}'),
+    raw_cursor(b'"b1f2"'),
+    raw_cursor(b'null'),
+], ids=['empty', 'not base64', 'not json', 'object', 'string', 'null'])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, SORT)
+
+
+@pytest.mark.parametrize('sort_values', [
+    [],
+    [8.5],
+    [8.5, 'b1f2', 'extra'],
+], ids=['empty', 'short', 'long'])
+def test_decode_cursor_rejects_wrong_length(sort_values):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor(sort_values), SORT)
+
+
+@pytest.mark.parametrize('value', [None, True, False, ['b1f2'], {'a': 1}])
+def test_decode_cursor_rejects_non_plain_values(value):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor([8.5, value]), SORT)
+
+
+def test_decode_cursor_rejects_listing_without_sort():
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor([8.5, 'b1f2']), [])
+
+
+@pytest.mark.parametrize('fields', [None, ''])
+def test_select_fields_defaults_to_whole_shape(fields):
+    assert select_fields(FilmShort, fields) == ('id', 'title', 'imdb_rating')
+
+
+@pytest.mark.parametrize('fields', [
+    'imdb_rating,title',
+    ' title , imdb_rating ',
+    'title,imdb_rating,title',
+    'title,,imdb_rating,',
+])
+def test_select_fields_keeps_shape_order_and_id(fields):
+    assert select_fields(FilmShort, fields) == ('id', 'title', 'imdb_rating')
+
+
+def test_select_fields_subset():
+    assert select_fields(Film, 'title') == ('id', 'title')
+    assert select_fields(Film, 'id') == ('id',)
+
+
+def test_select_fields_without_names_keeps_id():
+    assert select_fields(FilmShort, ',') == ('id',)
+
+
+def test_select_fields_rejects_unknown_names():
+    with pytest.raises(InvalidFields) as error:
+        select_fields(FilmShort, 'title,rating,Title,genre')
+    assert str(error.value) == 'Title, genre, rating'
+
+
+def test_projection_of_all_fields_is_the_shape():
+    assert projection(Film, select_fields(Film)) is Film
+
+
+def test_projection_is_cached():
+    fields = ('id', 'title')
+    assert projection(Film, fields) is projection(Film, fields)
+
+
+def test_projection_keeps_only_the_fields():
+    shape = projection(Film, ('id', 'title', 'description'))
+    doc = shape(id='1', title='Star', imdb_rating=8.5)
+    assert doc.dict() == {'id': '1', 'title': 'Star', 'description': None}
+
+
+def test_projection_validates_like_the_shape():
+    shape = projection(Film, ('id', 'imdb_rating', 'actors_names'))
+    doc = shape(id='1', imdb_rating='8.5')
+    assert doc.imdb_rating == 8.5
+    assert doc.actors_names is None
+    with pytest.raises(ValidationError):
+        shape(id='1')
+    with pytest.raises(ValidationError):
+        shape(id='1', imdb_rating='high')
@@ -0,0 +1,141 @@
+import pytest
+
+from services import cache
+from services.cache import (Cached, LRUCache, build_key, index_of, pack,
+                            unpack)
+
+
+class Clock:
+    """Stands in for the time module, so that TTLs pass on demand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+def test_lru_evicts_least_recently_used(clock):
+    lru = LRUCache(maxsize=2, ttl=10)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+    assert lru.get('c') == 3
+    assert len(lru) == 2
+
+
+def test_lru_set_refreshes_recency(clock):
+    lru = LRUCache(maxsize=2, ttl=10)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.set('a', 10)
+    lru.set('c', 3)
+    assert lru.get('a') == 10
+    assert lru.get('b') is None
+
+
+def test_lru_entry_expires(clock):
+    lru = LRUCache(maxsize=2, ttl=10)
+    lru.set('a', 1)
+    clock.now += 9
+    assert lru.get('a') == 1
+    clock.now += 2
+    assert lru.get('a') is None
+    assert len(lru) == 0
+
+
+def test_lru_ttl_is_capped_by_cache_ttl(clock):
+    lru = LRUCache(maxsize=2, ttl=10)
+    lru.set('short', 1, ttl=2)
+    lru.set('long', 2, ttl=100)
+    clock.now += 5
+    assert lru.get('short') is None
+    assert lru.get('long') == 2
+    clock.now += 6
+    assert lru.get('long') is None
+
+
+def test_lru_disabled_by_zero_size(clock):
+    lru = LRUCache(maxsize=0, ttl=10)
+    lru.set('a', 1)
+    assert lru.get('a') is None
+    assert len(lru) == 0
+
+
+def test_lru_delete_and_clear(clock):
+    lru = LRUCache(maxsize=2, ttl=10)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.delete('a')
+    lru.delete('missing')
+    assert lru.get('a') is None
+    lru.clear()
+    assert len(lru) == 0
+
+
+def test_pack_round_trip(clock):
+    raw = pack('{"id": "1"}', soft_ttl=60)
+    assert unpack(raw) == (Cached(b'{"id": "1"}'), False)
+
+
+def test_pack_keeps_cursor(clock):
+    raw = pack(b'[1, 2]', soft_ttl=60, cursor='WyJhIl0=')
+    assert unpack(raw) == (Cached(b'[1, 2]', 'WyJhIl0='), False)
+
+
+def test_unpack_stale_entry(clock):
+    raw = pack(b'[]', soft_ttl=60)
+    clock.now += 61
+    assert unpack(raw) == (Cached(b'[]'), True)
+
+
+def test_unpack_payload_with_newlines(clock):
+    payload = b'{"description": "a\\nb"}\n'
+    assert unpack(pack(payload, soft_ttl=60))[0].payload == payload
+
+
+@pytest.mark.parametrize('raw', [b'{"id": "1"}', b'[{"id": "1"}]'])
+def test_unpack_legacy_entry_is_fresh(clock, raw):
+    assert unpack(raw) == (Cached(raw), False)
+
+
+def test_build_key_ignores_parameter_order():
+    assert (build_key('movies', 'list', page=1, sort='-imdb_rating')
+            == build_key('movies', 'list', sort='-imdb_rating', page=1))
+
+
+@pytest.mark.parametrize('other', [
+    {'page': 2, 'sort': '-imdb_rating'},
+    {'page': 1, 'sort': 'imdb_rating'},
+    {'page': 1, 'sort': '-imdb_rating', 'cursor': None},
+    {'page': '1', 'sort': '-imdb_rating'},
+])
+def test_build_key_differs_in_any_parameter(other):
+    assert (build_key('movies', 'list', page=1, sort='-imdb_rating')
+            != build_key('movies', 'list', **other))
+
+
+def test_build_key_prefixes_index_and_method():
+    key = build_key('movies', 'search', query='dog')
+    assert key.startswith('movies:search:')
+    assert index_of(key) == 'movies'
+    assert build_key('person', 'search', query='dog') != key
+    assert build_key('movies', 'list', query='dog') != key
+
+
+def test_build_key_hashes_nested_values_canonically():
+    assert (build_key('movies', 'list', query={'b': 1, 'a': [1, 2]})
+            == build_key('movies', 'list', query={'a': [1, 2], 'b': 1}))